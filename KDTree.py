@@ -1,4 +1,6 @@
-from math import hypot
+from math import hypot, log, pi, sqrt
+from heapq import heappush, heapreplace
+import numpy as np
 
 class Node:
     def __init__(self, node=None, alpha=0, left=None, right=None):
@@ -10,66 +12,337 @@ class Node:
     __getitem__ = lambda self, x: self.node[x]
 
 class KDTree:
-    def __init__(self, root, alpha=None):
-        self.root   = Node(root, alpha)
-        self.length = 0
-        
+    """ 2D KD-Tree stored in preallocated arrays (coordinates, angles, child indices and
+    subtree sizes) that grow by doubling. Search is iterative with an explicit stack.
+
+    The tree is kept balanced with scapegoat partial rebuilds: whenever an insertion is
+    deeper than log(n)/log(1/balance), the deepest ancestor whose child holds more than
+    'balance' of its subtree is rebuilt with median splits """
+    def __init__(self, root, alpha=None, balance=0.7, capacity=1024):
+        self.capacity = 0
+        self.n        = 0 # Number of stored points, including the root
+        self._grow(capacity)
+
+        self.root     = self._new(root, alpha)
+        self.length   = 0
+        self.balance  = balance
+        self.rebuilds = 0
+        self._stack   = [0] * 64 # Pending (node, axis) pairs, encoded as 2*node+axis
+        self._bound   = [0.] * 64 # Distance from the query to the pending node's region
+
+    @classmethod
+    def from_points(cls, points, alphas=None, **kwargs):
+        """ Balanced tree over the (N, 2) points, built with median splits. Stored indices
+        follow the order of 'points' """
+        points = np.asarray(points, float).reshape(-1, 2)
+        self   = cls(points[0], None if alphas is None else alphas[0],
+                     capacity=max(len(points), 1024), **kwargs)
+        self.xs[:len(points)], self.ys[:len(points)] = points.T
+        if alphas is not None: self.alphas[:len(points)] = alphas
+        else:                  self.alphas[:len(points)] = np.nan
+        self.n, self.length = len(points), len(points)-1
+        self.root = self._rebuild(np.arange(self.n), 0)
+        return self
+
+    def _grow(self, capacity):
+        """ Reallocates the arrays with the given capacity, keeping the stored points """
+        old = self.n
+        def grown(arr, dtype):
+            new = np.zeros(capacity, dtype)
+            if arr is not None: new[:old] = arr[:old]
+            return new
+        get = lambda name: getattr(self, name, None)
+
+        self.xs,    self.ys    = grown(get('xs'), float),  grown(get('ys'), float)
+        self.alphas            = grown(get('alphas'), float)
+        self.left,  self.right = grown(get('left'), np.int64), grown(get('right'), np.int64)
+        self.size              = grown(get('size'), np.int64)
+        self.capacity          = capacity
+
+        # Memoryviews give plain python scalars, much faster than indexing the arrays
+        self._x, self._y, self._a = memoryview(self.xs), memoryview(self.ys), memoryview(self.alphas)
+        self._l, self._r, self._s = memoryview(self.left), memoryview(self.right), memoryview(self.size)
+
+    def _new(self, point, alpha):
+        if self.n == self.capacity: self._grow(2 * self.capacity)
+        i = self.n
+        self._x[i], self._y[i] = float(point[0]), float(point[1])
+        self._a[i] = float('nan') if alpha is None else alpha
+        self._l[i], self._r[i], self._s[i] = -1, -1, 1
+        self.n += 1
+        return i
+
+    points = property(lambda self: np.column_stack((self.xs[:self.n], self.ys[:self.n])))
+
     def addNode(self, new, alpha=None):
+        if isinstance(new, Node): new, alpha = new.node, new.alpha
+        i = self._new(new, alpha)
+        x, y = self._x[i], self._y[i]
+        _x, _y, _l, _r, _s = self._x, self._y, self._l, self._r, self._s
+
         axis = 0
-        cur = self.root
-        if not isinstance(new, Node): new = Node(new, alpha)
-        
+        cur  = self.root
+        path = [cur]
         while True:
-            if new[axis] < cur[axis]:
-                if cur.left is None:
-                    cur.left = new
+            _s[cur] += 1
+            key, split = (x, _x[cur]) if axis == 0 else (y, _y[cur])
+            # Keys equal to the split alternate sides (by subtree size), so duplicates stay balanced
+            if key < split or (key == split and _s[cur] & 1):
+                if _l[cur] == -1:
+                    _l[cur] = i
                     break
-                cur = cur.left
-                
+                cur = _l[cur]
+
             else:
-                if cur.right is None:
-                    cur.right = new
+                if _r[cur] == -1:
+                    _r[cur] = i
                     break
-                cur = cur.right
-            
+                cur = _r[cur]
+
             axis = 1 - axis
+            path.append(cur)
         self.length += 1
-    
+
+        if len(path) > log(_s[self.root]) / log(1/self.balance):
+            self._rebalance(path + [i])
+
+    def _rebalance(self, path):
+        """ Rebuilds the subtree of the deepest unbalanced ancestor along 'path' """
+        for depth in range(len(path)-2, -1, -1):
+            node, child = path[depth], path[depth+1]
+            if self._s[child] > self.balance * self._s[node]: break
+        else: return
+
+        subtree = self._rebuild(self._collect(node), depth % 2)
+        if depth == 0:                          self.root = subtree
+        elif self._l[path[depth-1]] == node:    self._l[path[depth-1]] = subtree
+        else:                                   self._r[path[depth-1]] = subtree
+        self.rebuilds += 1
+
+    def _collect(self, node):
+        nodes, stack = [], [node]
+        while stack:
+            cur = stack.pop()
+            if cur == -1: continue
+            nodes.append(cur)
+            stack += [self._l[cur], self._r[cur]]
+        return np.array(nodes)
+
+    def _rebuild(self, nodes, axis):
+        """ Median-split subtree of 'nodes', returns its root. Points equal to the median may
+        go to either side, so that repeated points are split evenly too """
+        root, tasks = -1, [(nodes, axis, -1, None)]
+        while tasks:
+            nodes, axis, parent, children = tasks.pop()
+
+            # Sorting small subtrees in python avoids the per call overhead of numpy
+            if len(nodes) > 64:
+                coord = (self.xs if axis == 0 else self.ys)[nodes]
+                order = np.argsort(coord, kind='stable')
+                nodes = nodes[order]
+            else:
+                coord = self._x if axis == 0 else self._y
+                nodes = sorted(nodes, key=coord.__getitem__)
+            mid = len(nodes)//2
+
+            node = int(nodes[mid])
+            self._l[node], self._r[node], self._s[node] = -1, -1, len(nodes)
+            if parent == -1: root = node
+            else:            children[parent] = node
+
+            if mid > 0:              tasks.append((nodes[:mid],   1-axis, node, self._l))
+            if mid+1 < len(nodes):   tasks.append((nodes[mid+1:], 1-axis, node, self._r))
+        return root
+
+    def remove(self, points):
+        """ Removes the stored points equal to any of 'points' and rebuilds the tree over the
+        remaining ones with median splits. The point the tree was created with is always kept """
+        drop = set((float(p[0]), float(p[1])) for p in points)
+        keep = np.array([0] + [i for i in range(1, self.n) if (self._x[i], self._y[i]) not in drop], np.int64)
+        for arr in (self.xs, self.ys, self.alphas): arr[:len(keep)] = arr[keep]
+        self.length -= self.n - len(keep)
+        self.n       = len(keep)
+        self.root    = self._rebuild(np.arange(self.n), 0)
+        self.rebuilds += 1
+
+    @property
+    def depth(self):
+        """ Number of levels in the tree """
+        depth, stack = 0, [(self.root, 1)]
+        while stack:
+            cur, level = stack.pop()
+            if cur == -1: continue
+            depth = max(depth, level)
+            stack += [(self._l[cur], level+1), (self._r[cur], level+1)]
+        return depth
+
     def nearestNode(self, new, alpha=None, return_node=False):
-        new = Node(new, alpha)
-        node, dist = self._nearestNode(new, self.root, 0, None, float('inf'))
-        return node if return_node else tuple(node.node), dist
-
-    def _nearestNode(self, new, cur, axis, minNode, minDist):
-        dist = hypot(new[0]-cur[0], new[1]-cur[1])
-        if dist < minDist:
-            minNode, minDist = cur, dist
-
-        if new[axis] < cur[axis]:
-            if cur.left is not None:
-                minNode, minDist = self._nearestNode(new, cur.left, 1-axis, minNode, minDist)
-            
-            if cur.right is not None and cur[axis] - new[axis] < minDist:
-                minNode, minDist = self._nearestNode(new, cur.right, 1-axis, minNode, minDist)
-            
-        else:
-            if cur.right is not None:
-                minNode, minDist = self._nearestNode(new, cur.right, 1-axis, minNode, minDist)
-
-            if cur.left is not None and new[axis] - cur[axis] < minDist:
-                minNode, minDist = self._nearestNode(new, cur.left, 1-axis, minNode, minDist)
-        
-        return minNode, minDist
-        
+        i, dist = self._nearest(float(new[0]), float(new[1]), alpha)
+        if return_node: return Node((self._x[i], self._y[i]), self._a[i]), dist
+        return (self._x[i], self._y[i]), dist
+
+    def _distance(self, qx, qy, qa=None):
+        """ Distance from q=(qx,qy) to the stored point of an index, None for the planar
+        distance. It must be at least the planar distance, which bounds the search and is
+        checked first """
+        return None
+
+    def _nearest(self, qx, qy, qa=None):
+        """ Index of and distance to the stored point nearest to q=(qx,qy) (with heading qa,
+        for subclasses whose _distance uses it) """
+        _x, _y, _l, _r = self._x, self._y, self._l, self._r
+        stack, bound = self._stack, self._bound
+        best, bestDist = -1, float('inf')
+        distance = self._distance(qx, qy, qa)
+
+        stack[0], bound[0], top = 2*self.root, 0., 1
+        while top:
+            top -= 1
+            if bound[top] >= bestDist: continue
+            cur, axis = stack[top] >> 1, stack[top] & 1
+
+            # Descend towards the query, deferring the far side of every split
+            while cur != -1:
+                x, y = _x[cur], _y[cur]
+                dist = hypot(qx-x, qy-y)
+                if dist < bestDist:
+                    if distance is not None: dist = distance(cur)
+                    if dist < bestDist: best, bestDist = cur, dist
+
+                diff = qx-x if axis == 0 else qy-y
+                near, far = (_l[cur], _r[cur]) if diff < 0 else (_r[cur], _l[cur])
+                if far != -1 and abs(diff) < bestDist:
+                    if top == len(stack): stack += [0]*top; bound += [0.]*top
+                    stack[top], bound[top] = 2*far + 1-axis, abs(diff)
+                    top += 1
+                cur, axis = near, 1-axis
+
+        return best, bestDist
+
+    def nearest_batch(self, points):
+        """ Nearest stored point of each of the (N, 2) query points. All queries descend the
+        tree together: a greedy descent gives every query an initial bound, then a pruned
+        breadth-first sweep over (query, node) pairs finds the exact answers.
+        Returns, per query, the index of its nearest stored point (into self.points) and
+        the distance to it """
+        Q     = np.asarray(points, float).reshape(-1, 2)
+        P     = self.points
+        L, R  = self.left[:self.n], self.right[:self.n]
+        axes  = self._axes()
+        query = np.arange(len(Q))
+        best, bestDist = np.full(len(Q), self.root), np.full(len(Q), np.inf)
+
+        # Greedy descent to a leaf, deferring the far side of every split
+        cur, pending = np.full(len(Q), self.root), []
+        while len(query):
+            dist   = np.hypot(*(Q[query] - P[cur]).T)
+            better = dist < bestDist[query]
+            best[query[better]], bestDist[query[better]] = cur[better], dist[better]
+
+            diff = Q[query, axes[cur]] - P[cur, axes[cur]]
+            near, far = np.where(diff < 0, L[cur], R[cur]), np.where(diff < 0, R[cur], L[cur])
+            pending.append((query[far != -1], far[far != -1], np.abs(diff[far != -1])))
+            query, cur = query[near != -1], near[near != -1]
+
+        # Sweep the deferred subtrees, dropping pairs whose region is farther than the best
+        query, cur, bound = (np.concatenate(arrays) for arrays in zip(*pending)) if pending else \
+                                (np.zeros(0, int), np.zeros(0, int), np.zeros(0))
+        while len(query):
+            keep = bound < bestDist[query]
+            query, cur, bound = query[keep], cur[keep], bound[keep]
+
+            dist = np.hypot(*(Q[query] - P[cur]).T)
+            np.minimum.at(bestDist, query, dist)
+            hit  = dist == bestDist[query]
+            best[query[hit]] = cur[hit]
+
+            diff = Q[query, axes[cur]] - P[cur, axes[cur]]
+            near, far = np.where(diff < 0, L[cur], R[cur]), np.where(diff < 0, R[cur], L[cur])
+            farOk     = (far != -1) & (np.abs(diff) < bestDist[query])
+            query = np.concatenate((query[near != -1], query[farOk]))
+            bound = np.concatenate((bound[near != -1], np.abs(diff[farOk])))
+            cur   = np.concatenate((near[near != -1], far[farOk]))
+
+        return best, bestDist
+
+    def _axes(self):
+        """ Splitting axis of every stored node, from its depth """
+        axes, level, axis = np.zeros(self.n, int), np.array([self.root]), 0
+        while len(level):
+            axes[level] = axis
+            level = np.concatenate((self.left[level], self.right[level]))
+            level, axis = level[level != -1], 1-axis
+        return axes
+
+    def k_nearest(self, new, k, return_node=False):
+        """ The k stored points nearest to 'new' as (point, distance) pairs, nearest first """
+        return self._found(self._search(float(new[0]), float(new[1]), k, float('inf')), return_node)
+
+    def within_radius(self, new, radius, return_node=False):
+        """ All stored points within 'radius' of 'new' as (point, distance) pairs, nearest first """
+        return self._found(self._search(float(new[0]), float(new[1]), self.n, radius), return_node)
+
+    def neighbours(self, new, k, radius=float('inf')):
+        """ Indices of and distances to the (up to) k stored points within 'radius' of 'new',
+        nearest first """
+        found = sorted((-negDist, i) for negDist, i in self._search(float(new[0]), float(new[1]), k, radius))
+        return [i for _, i in found], [d for d, _ in found]
+
+    def _found(self, heap, return_node):
+        found = sorted((-negDist, i) for negDist, i in heap)
+        if return_node: return [(Node((self._x[i], self._y[i]), self._a[i]), d) for d, i in found]
+        return [((self._x[i], self._y[i]), d) for d, i in found]
+
+    def _search(self, qx, qy, k, radius):
+        """ Up to k stored points within 'radius' of q=(qx,qy), as a heap of (-distance, index) """
+        _x, _y, _l, _r = self._x, self._y, self._l, self._r
+        heap, limit, stack = [], radius, [(self.root, 0, 0.)]
+
+        while stack:
+            cur, axis, bound = stack.pop()
+            if bound > limit: continue
+
+            while cur != -1:
+                x, y = _x[cur], _y[cur]
+                dist = hypot(qx-x, qy-y)
+                if dist <= limit:
+                    if len(heap) < k:         heappush(heap, (-dist, cur))
+                    elif dist < -heap[0][0]:  heapreplace(heap, (-dist, cur))
+                    if len(heap) == k:        limit = min(radius, -heap[0][0])
+
+                diff = qx-x if axis == 0 else qy-y
+                near, far = (_l[cur], _r[cur]) if diff < 0 else (_r[cur], _l[cur])
+                if far != -1 and abs(diff) <= limit: stack.append((far, 1-axis, abs(diff)))
+                cur, axis = near, 1-axis
+
+        return heap
+
     def __str__(self):
         self.printTree(self.root, 0)
         return ""
-    
+
     def printTree(self, node, depth=0, newNode=None):
-        if node is None: return
+        if node == -1: return
+        point = (self._x[node], self._y[node])
         if newNode is not None:
-            print(" | "*depth, node, "%0.4f"%hypot(newNode[0]-node[0], newNode[1]-node[1]))
+            print(" | "*depth, point, "%0.4f"%hypot(newNode[0]-point[0], newNode[1]-point[1]))
         else:
-            print(" | "*depth, node)
-        self.printTree(node.left, depth+1, newNode)
-        self.printTree(node.right, depth+1, newNode)
\ No newline at end of file
+            print(" | "*depth, point)
+        self.printTree(self._l[node], depth+1, newNode)
+        self.printTree(self._r[node], depth+1, newNode)
+
+class SE2KDTree(KDTree):
+    """ KD-Tree over (x, y, alpha) poses with the weighted SE(2) distance
+    sqrt(dx^2 + dy^2 + (weight*dalpha)^2), dalpha wrapped to [-pi, pi]. Splits are on x and y
+    only, which stay valid lower bounds for pruning. 'weight' converts radians to distance,
+    e.g. the radius of the robot footprint """
+    def __init__(self, root, alpha=0., weight=1., **kwargs):
+        KDTree.__init__(self, root, alpha, **kwargs)
+        self.weight = weight
+
+    def _distance(self, qx, qy, qa=None):
+        if qa is None: return None
+        def distance(i, _x=self._x, _y=self._y, _a=self._a, weight=self.weight):
+            turn = (qa - _a[i] + pi) % (2*pi) - pi
+            return sqrt((qx-_x[i])**2 + (qy-_y[i])**2 + (weight*turn)**2)
+        return distance
@@ -0,0 +1,74 @@
+from __future__ import division
+
+import sys
+import json
+import time
+import multiprocessing as mp
+
+from server import init_worker, solve
+
+def read_queries(path, mode='unidirectional'):
+    """ Start/goal pairs of a batch file, one pair per line as 'sx sy gx gy' (or 'sx sy sa
+    gx gy ga' for the extra mode). Blank lines and lines starting with # are skipped """
+    size    = 6 if mode == 'extra' else 4
+    queries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            values = tuple(map(float, line.split()))
+            if len(values) != size:
+                raise ValueError("%s:%d: expected %d numbers for the %s mode, got %d"%(path, number, size, mode,
+                                                                                       len(values)))
+            half = len(values) // 2
+            queries.append((values[:half], values[half:]))
+    return queries
+
+def _solve(task):
+    """ Solves one query in a worker. The deadline starts when the worker picks it up, and a
+    query raising an error fails alone instead of the whole batch """
+    i, job, timeout = task
+    deadline = float('inf') if timeout is None else time.time() + timeout
+    try:
+        return i, solve(job[:7] + (deadline,) + job[8:])
+    except Exception as e:
+        return i, {'success': False, 'error': repr(e)}
+
+def run(world, queries, mode, step_size, max_size, roadmap=None, workers=None, timeout=None,
+        seed=0, with_stats=False, out=sys.stdout, log=sys.stderr):
+    """ Solves the queries on a pool of 'workers' processes (in-process if 0) and writes
+    each result to 'out' as a JSON line as soon as it is done, in completion order. Query i
+    uses seed + i, so results do not depend on the number of workers. A query running
+    longer than 'timeout' seconds is abandoned. Returns the number of solved queries """
+    t_start  = time.perf_counter()
+    worlds   = {'world': world}
+    roadmaps = {'world': roadmap} if roadmap is not None else {}
+    tasks    = ((i, ('world', mode, start, goal, step_size, max_size, seed + i, None, with_stats), timeout)
+                for i, (start, goal) in enumerate(queries))
+
+    pool = None
+    if workers == 0:
+        init_worker(worlds, roadmaps)
+        results = map(_solve, tasks)
+    else:
+        pool    = mp.Pool(workers or mp.cpu_count(), init_worker, (worlds, roadmaps))
+        results = pool.imap_unordered(_solve, tasks)
+
+    done, solved = 0, 0
+    try:
+        for i, reply in results:
+            start, goal = queries[i]
+            record = {'index': i, 'start': list(start), 'goal': list(goal)}
+            record.update(reply if reply is not None else {'success': False, 'error': 'timeout'})
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            done, solved = done + 1, solved + record['success']
+        if pool is not None: pool.close()
+    except BaseException:
+        if pool is not None: pool.terminate()
+        raise
+    finally:
+        if pool is not None: pool.join()
+
+    if log: print("%d / %d solved in %.3fs"%(solved, done, time.perf_counter() - t_start), file=log)
+    return solved
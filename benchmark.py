@@ -0,0 +1,162 @@
+from __future__ import division
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import numpy as np
+
+from obstacles import Obstacles
+from portfolio import PLANNERS
+from samplers  import from_spec
+from stats     import Stats
+from utilities import get_obstacle_course, get_start_and_goal
+
+# Rectangle poses of the extra mode, worlds not listed use the start/goal file positions
+EXTRA_POSES = {'world_obstacles.txt': ((75., 50., 0.), (482., 577., math.pi/2)),
+               'narrow_obstacles.txt': ((60., 540., 0.), (540., 60., math.pi/2))}
+
+# Metrics compared against the baseline, and whether a larger value is worse
+METRICS = {'time': True, 'nodes': True, 'rejected': True, 'checks': True,
+           'success_rate': False, 'length': True}
+
+def load_world(spec):
+    """ World, start and goal of a 'obstacles.txt[:start_goal.txt]' spec """
+    obstacle_path, _, goal_path = spec.partition(':')
+    world = Obstacles(get_obstacle_course(obstacle_path).to_polygons())
+    start, goal = get_start_and_goal(goal_path or 'start_goal.txt')
+    return world, tuple(map(float, start)), tuple(map(float, goal))
+
+def run_case(world, mode, start, goal, step_size, max_size, seed, sampler='uniform', sigma=20.):
+    """ One seeded planner run, returns its record. Runs are deterministic for a seed, so
+    the counters come from a second, instrumented run and the timing is not inflated
+    by the instrumentation """
+    planner, stepped = PLANNERS[mode]
+    args   = (step_size, max_size) if stepped else (max_size,)
+    kwargs = {'sampler': from_spec(sampler, sigma)} if sampler != 'uniform' else {}
+    t_start = time.perf_counter()
+    result  = planner(world, start, goal, *args, rng=np.random.RandomState(seed), **kwargs)
+    elapsed = time.perf_counter() - t_start
+
+    stats    = Stats()
+    planner(world, start, goal, *args, rng=np.random.RandomState(seed), stats=stats, **kwargs)
+    counters = stats.counters
+    return {'mode': mode, 'step_size': step_size if stepped else None, 'seed': seed, 'sampler': sampler,
+            'time': elapsed, 'nodes': result.n, 'rejected': counters.get('samples_rejected', 0),
+            'checks': counters.get('point_checks', 0) + counters.get('segment_checks', 0),
+            'success': result.success, 'length': result.length if result.success else None,
+            'stats': stats.as_dict()}
+
+def benchmark(worlds, modes, step_sizes, seeds, max_size, samplers=('uniform',), sigma=20., log=sys.stderr):
+    """ Runs every mode over the matrix of worlds, step sizes, samplers and seeds. The prm
+    mode only runs with the uniform sampler its roadmap is built with """
+    records = []
+    for spec in worlds:
+        world, start, goal = load_world(spec)
+        for mode in modes:
+            poses = EXTRA_POSES.get(os.path.basename(spec.partition(':')[0]),
+                                    (start + (0.,), goal + (math.pi/2,)))
+            s, g  = poses if mode == 'extra' else (start, goal)
+            for step_size in (step_sizes if PLANNERS[mode][1] else [None]):
+                for sampler in (samplers if mode != 'prm' else ['uniform']):
+                    for seed in seeds:
+                        record = run_case(world, mode, s, g, step_size, max_size, seed, sampler, sigma)
+                        record['world'] = spec
+                        records.append(record)
+                        if log: print("%-20s %-14s step %-4s %-12s seed %-3d %7.3fs n = %-5d %s"%(spec, mode,
+                                      step_size, sampler, seed, record['time'], record['nodes'],
+                                      'ok' if record['success'] else 'FAIL'), file=log)
+    return records
+
+def summarize(records):
+    """ Aggregates the records of every (world, mode, step size, sampler) case. The sampler
+    is left out of the uniform case keys, which are those of earlier results """
+    cases = {}
+    for r in records:
+        key = "%s|%s|%s"%(r['world'], r['mode'], r['step_size'])
+        if r.get('sampler', 'uniform') != 'uniform': key += "|%s"%r['sampler']
+        cases.setdefault(key, []).append(r)
+
+    summary = {}
+    for key, rs in sorted(cases.items()):
+        lengths = [r['length'] for r in rs if r['success']]
+        summary[key] = {'runs': len(rs),
+                        'time': float(np.median([r['time'] for r in rs])),
+                        'time_max': max(r['time'] for r in rs),
+                        'nodes': float(np.mean([r['nodes'] for r in rs])),
+                        'rejected': float(np.mean([r['rejected'] for r in rs])),
+                        'checks': float(np.mean([r['checks'] for r in rs])),
+                        'success_rate': len(lengths) / len(rs),
+                        'length': float(np.mean(lengths)) if lengths else None}
+    return summary
+
+def compare(summary, baseline, tolerance=0.1, out=sys.stdout):
+    """ Prints the relative change of every metric against the baseline summary. Changes
+    for the worse beyond 'tolerance' are flagged, returns the number of them """
+    regressions = 0
+    for key in sorted(set(summary) | set(baseline)):
+        if key not in summary or key not in baseline:
+            print("%s: only in %s"%(key, 'baseline' if key in baseline else 'results'), file=out)
+            continue
+        cells = []
+        for metric, larger_is_worse in METRICS.items():
+            new, old = summary[key][metric], baseline[key][metric]
+            if new is None or old is None:
+                cells.append("%s n/a"%metric)
+                continue
+            change = (new - old) / old if old else (0. if new == old else math.inf)
+            worse  = change > tolerance if larger_is_worse else change < -tolerance
+            regressions += worse
+            cells.append("%s %+.1f%%%s"%(metric, 100*change, ' !' if worse else ''))
+        print("%s: %s"%(key, ', '.join(cells)), file=out)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Benchmarks the RRT planners over worlds, step sizes and seeds",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--worlds", nargs="+", default=["world_obstacles.txt:start_goal.txt"],
+                            help="Worlds as obstacle_path[:start_goal_path]")
+    parser.add_argument("--modes", nargs="+", default=["unidirectional", "bidirectional", "extra"],
+                            choices=sorted(PLANNERS), help="Planners to run")
+    parser.add_argument("--step-sizes", nargs="+", default=[20, 50], type=int,
+                            help="Step sizes of the uni/bi-directional RRT and RRT*")
+    parser.add_argument("--samplers", nargs="+", default=["uniform"],
+                            help="Samplers to run: uniform, gaussian, bridge or mixtures like uniform:0.5,bridge:0.5")
+    parser.add_argument("--sigma", default=20., type=float,
+                            help="Spread of the gaussian and bridge samplers")
+    parser.add_argument("--seeds", default=10, type=int,
+                            help="Number of seeds (0 .. seeds-1) per case")
+    parser.add_argument("--max-search", default=2000, type=int,
+                            help="Max number of nodes to expand RRT")
+    parser.add_argument("-o", "--output", default=None,
+                            help="Write the records and summary as JSON to this file")
+    parser.add_argument("--baseline", default=None,
+                            help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", default=0.1, type=float,
+                            help="Relative change for the worse flagged as a regression")
+
+    args = parser.parse_args()
+    for spec in args.samplers:
+        try:
+            from_spec(spec)
+        except ValueError as e:
+            parser.error(str(e))
+
+    records = benchmark(args.worlds, args.modes, args.step_sizes, range(args.seeds), args.max_search,
+                        args.samplers, args.sigma)
+    results = {'python': platform.python_version(), 'numpy': np.__version__,
+               'max_search': args.max_search, 'records': records, 'summary': summarize(records)}
+
+    if args.output:
+        with open(args.output, 'w') as f: json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        sys.exit(1 if compare(results['summary'], baseline['summary'], args.tolerance) else 0)
+
+    for key, stats in results['summary'].items():
+        print(key, ', '.join("%s %s"%(k, "%.4g"%v if isinstance(v, float) else v) for k, v in stats.items()))
@@ -1,32 +1,46 @@
 from __future__ import division
 
 import math
+import time
 import numpy as np
 
 from KDTree    import KDTree
 from obstacles import Obstacles
-from utilities import gen_next, PathTree
-
-def run(obstacles, start, goal, step_size, max_size, plotter):
+from plotters  import NullPlotter
+from samplers  import GOAL_BIAS, UniformSampler, take_goal
+from stats     import NULL_STATS, TimedObserver, restores_stats
+from utilities import gen_next, PathTree, PlannerResult
+from visibility import VisibilityPolygon
+from unidirectionalrrt import draw_path
+
+@restores_stats
+def plan(obstacles, start, goal, step_size, max_size, observer=None, rng=None, stats=None, sampler=None,
+         goal_bias=GOAL_BIAS):
+    """ Grows RRTs from start and goal until they meet, reporting progress to 'observer'
+    and the time spent in each phase to 'stats'. A new node that sees the root of the other
+    tree, looked up in the visibility polygons of start and goal, joins it directly. Both
+    trees draw from sampler(obstacles, rng=rng), or aim at the other root with probability
+    goal_bias """
+    observer = observer if observer is not None else NullPlotter()
+    rng      = rng if rng is not None else np.random
+    stats    = stats if stats is not None else NULL_STATS
+    timed    = stats.enabled # The phases of the search loop are only timed if set
+    if timed: observer = TimedObserver(observer, stats)
+    t_start  = time.perf_counter()
     circ_rad = min(step_size/5, 5)
     final_pos = [np.array(goal), np.array(start)]
-
-    # Pre-compute for generating new random points in Q_free
-    minp, maxp   = obstacles.vertices.min(0), obstacles.vertices.max(0)
-    span, offset = (maxp-minp)*1.1, minp-(maxp-minp)*0.05
-
-    def gen_valid_rand(valid_function):
-        """ Generates a valid q_rand in Q_free given a validity function """
-        tmp     = np.random.random(2) * span + offset
-        while not valid_function(*tmp):
-            tmp = np.random.random(2) * span + offset
-        return tmp
+    roots     = [tuple(goal[:2]), tuple(start[:2])] # The root of the other tree
 
     KD    = [KDTree(start), KDTree(goal)]
     RRT   = [PathTree(start), PathTree(goal)]
     n     = 1
     rnd_display = False
-    obstacles = Obstacles(obstacles.to_polygons())
+    if not isinstance(obstacles, Obstacles): obstacles = Obstacles(obstacles.to_polygons())
+    sampler   = (sampler or UniformSampler)(obstacles, rng=rng)
+    with stats.timer('visibility'):
+        views = [VisibilityPolygon(obstacles, q) for q in roots]
+    t_search  = time.perf_counter()
+    obstacles.stats = stats
 
     """
     • Expand tree T_1 randomly, add node q_new
@@ -37,69 +51,107 @@ def run(obstacles, start, goal, step_size, max_size, plotter):
     other tree until they meet
     """
 
-    trials = 0
+    trials, found, sees = 0, False, False
     q_new, last_expanded = None, -1
-    while KD[0].length + KD[1].length < 1000:
+    while KD[0].length + KD[1].length < max_size:
         trials += 1
         if rnd_display: circ1.remove(); rnd_display = False
         n = 1 - n
         
         # If the last expanded node was in the other tree, try expanding towards q_new
         if last_expanded != n and q_new is not None:
+            if timed: t0 = time.perf_counter()
             q_near, dist = KD[n].nearestNode(q_new)
+            if timed: stats.add('nearest', t0)
             q_next = gen_next(q_near, q_new, step_size) if dist>step_size else q_new
             
             # Expansion towards q_new is possible. Add to path and goal check
-            if obstacles.point_is_valid(*q_next) and \
-                not obstacles.check_collisions((q_near, q_next)):
+            if timed: t0 = time.perf_counter()
+            free = obstacles.point_is_valid(*q_next) and \
+                not obstacles.check_collisions((q_near, q_next))
+            if timed: stats.add('connect', t0)
+            if free:
+                if timed: t0 = time.perf_counter()
                 RRT[n].addPath(q_near, q_next)
                 KD[n].addNode(q_next)
+                if timed: stats.add('insert', t0)
                 
-                plotter.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=1)
-                plotter.draw_line(q_near, q_next, color='kb'[n], zorder=1)
-
-                if q_next == q_new: break # Path found
+                observer.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=1)
+                observer.draw_line(q_near, q_next, color='kb'[n], zorder=1)
+
+                if q_next == q_new: found = True; break # Path found
+                if timed: t0 = time.perf_counter()
+                sees = views[n].visible(q_next)
+                if timed: stats.add('goal_line', t0)
+                if sees: found = True; break
                 q_new, last_expanded, trials = q_next, n, 0 # Update for next iteration
                 continue
 
         # If last expanded node was not in the other tree or expansion to q_new not possible
         # Try to expand to q_rand if possible
-        q_rand = gen_valid_rand(obstacles.point_is_valid) if np.random.randint(0,100)>5 else final_pos[n]
-        rnd_display, circ1 = True, plotter.draw_circle(q_rand, 5, zorder=5)
+        if timed: t0 = time.perf_counter()
+        q_rand = final_pos[n] if take_goal(rng, goal_bias) else sampler.sample()
+        if timed: stats.add('sample', t0)
+        rnd_display, circ1 = True, observer.draw_circle(q_rand, 5, zorder=5)
 
+        if timed: t0 = time.perf_counter()
         q_near, dist = KD[n].nearestNode(q_rand)
+        if timed: stats.add('nearest', t0)
         if dist < step_size:
             if trials < 10: continue
             q_next = tuple(q_rand)
         else:
             q_next = gen_next(q_near, q_rand, step_size)
-            if not obstacles.point_is_valid(*q_next): continue
+            if timed: t0 = time.perf_counter()
+            valid = obstacles.point_is_valid(*q_next)
+            if timed: stats.add('point_check', t0)
+            if not valid: continue
         
-        if obstacles.check_collisions((q_near, q_next)): continue
+        if timed: t0 = time.perf_counter()
+        collides = obstacles.check_collisions((q_near, q_next))
+        if timed: stats.add('collision', t0)
+        if collides: continue
 
+        if timed: t0 = time.perf_counter()
         KD[n].addNode(q_next)
         RRT[n].addPath(q_near, q_next)
+        if timed: stats.add('insert', t0)
 
-        plotter.draw_line(q_near, q_next, color='kb'[n], zorder=1)
-        plotter.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=1)
+        observer.draw_line(q_near, q_next, color='kb'[n], zorder=1)
+        observer.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=1)
 
+        if timed: t0 = time.perf_counter()
+        sees = views[n].visible(q_next)
+        if timed: stats.add('goal_line', t0)
+        if sees: found = True; break
         q_new, last_expanded, near_count = q_next, n, 0
 
-    print("n =", KD[0].length + KD[1].length, "(%d, %d)"%(KD[0].length, KD[1].length))
-
-    # Plot out goal path
-    cur = RRT[0][tuple(q_next)]
-    while cur.parent:
-        plotter.draw_line(cur, cur.parent, update=False, color='y', zorder=3)
-        plotter.draw_circle(cur, circ_rad*1.5, update=False, facecolor='xkcd:green', edgecolor='k', zorder=4)
-        cur = cur.parent
-
-    cur = RRT[1][tuple(q_next)]
-    while cur.parent:
-        plotter.draw_line(cur, cur.parent, update=False, color='y', zorder=3)
-        plotter.draw_circle(cur, circ_rad*1.5, update=False, facecolor='xkcd:green', edgecolor='k', zorder=4)
-        cur = cur.parent
-    plotter.update()
+    t_end   = time.perf_counter()
+    stats.count('samples_drawn', sampler.drawn)
+    stats.count('samples_rejected', sampler.rejected)
+    stats.count('kd_rebuilds', KD[0].rebuilds + KD[1].rebuilds)
+    timings = {'setup': t_search-t_start, 'search': t_end-t_search, 'total': t_end-t_start}
+    path    = None
+    if found and sees:
+        # The last node sees the root of the other tree, which becomes the meeting node
+        RRT[n].addPath(q_next, roots[n])
+        observer.draw_line(q_next, roots[n], color='kb'[n], zorder=1)
+        q_next = roots[n]
+    if found:
+        # Both trees contain the meeting node, join the two half-paths there
+        path = RRT[0].pathTo(q_next) + RRT[1].pathTo(q_next)[-2::-1]
+    return PlannerResult(path, RRT, KD[0].length + KD[1].length, timings)
+
+def run(obstacles, start, goal, step_size, max_size, plotter=None, stats=None, sampler=None,
+        goal_bias=GOAL_BIAS):
+    result = plan(obstacles, start, goal, step_size, max_size, plotter, stats=stats, sampler=sampler,
+                  goal_bias=goal_bias)
+    KD0, KD1 = (len(tree.dict)-1 for tree in result.tree)
+    print("n =", result.n, "(%d, %d)"%(KD0, KD1))
+
+    if result.success and plotter is not None:
+        draw_path(result.path, plotter, min(step_size/5, 5), color='y')
+    return result
 
 if __name__ == '__main__':
     from ImageGenerator import ImageGenerator
@@ -0,0 +1,143 @@
+from __future__ import division
+
+import os
+import math
+import hashlib
+import numpy as np
+
+from occupancy import FREE, OCCUPIED, BOUNDARY
+from spatial   import _expand
+
+class CSpaceSlices:
+    """ Configuration space bitmaps of a rectangle robot, one per slice of headings.
+
+    Slice k covers the headings within half a slice of k*2pi/slices. Cell (ix, iy) of a
+    slice is OCCUPIED if the robot collides for every position in the cell and heading in
+    the slice, FREE if it collides for none of them and BOUNDARY otherwise, in which case
+    the exact test is needed. A pose collides when the (closed) rectangle overlaps an
+    obstacle, which also covers obstacles small enough to fit inside the rectangle.
+
+    The rectangle has the given half extents along its x and y axes at heading 0. Every
+    robot point lies within 'margin' of where it would be at the slice heading and cell
+    center, so the rectangle grown by the margin gives the FREE cells and the rectangle
+    shrunk by it the OCCUPIED ones.
+    """
+    def __init__(self, obstacles, half_extents, slices=36, resolution=2., max_cells=1 << 24):
+        hx, hy     = map(float, half_extents)
+        reach      = math.hypot(hx, hy)
+        minp, maxp = obstacles.bounds
+        extent     = np.maximum(maxp - minp, 1e-9) + 2*reach
+
+        # Coarsen the grid until all slices fit in the memory budget
+        resolution = float(resolution)
+        while slices * np.prod(np.floor(extent/resolution) + 3) > max_cells: resolution *= 2
+
+        self.half_extents = (hx, hy)
+        self.slices       = int(slices)
+        self.resolution   = resolution
+        self.origin       = minp.astype(float) - reach - resolution
+        self.shape        = tuple(int(n) for n in np.floor(extent/resolution) + 3)
+        self.margin       = reach * math.pi / self.slices + resolution / math.sqrt(2)
+        self.cells        = np.zeros((self.slices,) + self.shape, np.uint8)
+
+        # Away from every edge, the robot is entirely inside or outside, the center decides
+        centers = self.origin + (np.indices(self.shape).reshape(2, -1).T + 0.5) * resolution
+        inside  = ~obstacles.point_is_valid_batch(centers)
+        for k in range(self.slices):
+            self.cells[k] = self._rasterize(obstacles.edges, centers, inside, 2*math.pi*k/self.slices, reach)
+
+    def _rasterize(self, edges, centers, inside, alpha, reach, batch_size=1 << 22):
+        """ States of the cells of the slice at heading alpha """
+        (hx, hy), m, res = self.half_extents, self.margin, self.resolution
+        nx, ny = self.shape
+        near   = np.zeros(nx*ny, bool)
+        hit    = np.zeros(nx*ny, bool)
+
+        # Edge midpoints and half vectors, and cell centers, in the robot frame
+        c, s   = math.cos(alpha), math.sin(alpha)
+        rot    = lambda v: np.stack([c*v[...,0] + s*v[...,1], c*v[...,1] - s*v[...,0]], -1)
+        mid    = rot((edges[:,0] + edges[:,1]) / 2)
+        hvec   = rot((edges[:,1] - edges[:,0]) / 2)
+        half   = np.abs(hvec)
+        rc     = rot(centers)
+
+        # Cells within reach + margin of each edge's bounding box
+        lo = np.maximum(np.floor((edges.min(1) - reach - m - self.origin) / res).astype(int), 0)
+        hi = np.minimum(np.floor((edges.max(1) + reach + m - self.origin) / res).astype(int), [nx-1, ny-1])
+        counts = (hi[:,0] - lo[:,0] + 1) * (hi[:,1] - lo[:,1] + 1)
+
+        # Separating axis test of each edge against the grown and shrunk rectangles
+        for chunk in np.array_split(np.arange(len(edges)), max(1, counts.sum() // batch_size + 1)):
+            edge, row = _expand(lo[chunk,1], hi[chunk,1] - lo[chunk,1] + 1)
+            edge      = chunk[edge]
+            pair, col = _expand(lo[edge,0], hi[edge,0] - lo[edge,0] + 1)
+            edge, cell = edge[pair], col*ny + row[pair]
+
+            mx = mid[edge,0] - rc[cell,0]
+            my = mid[edge,1] - rc[cell,1]
+            ax, ay = half[edge,0], half[edge,1]
+            n  = np.abs(mx*hvec[edge,1] - my*hvec[edge,0])
+            for (ex, ey), out in (((hx + m, hy + m), near), ((hx - m, hy - m), hit)):
+                if ex <= 0 or ey <= 0: continue
+                touch = (np.abs(mx) <= ex + ax) & (np.abs(my) <= ey + ay) & (n <= ex*ay + ey*ax)
+                out[cell[touch]] = True
+
+        states = np.where(near, BOUNDARY, np.where(inside, OCCUPIED, FREE)).astype(np.uint8)
+        states[hit] = OCCUPIED
+        return states.reshape(nx, ny)
+
+    def slice_of(self, alpha):
+        """ Slice containing the heading(s) alpha """
+        return np.round(np.asarray(alpha) * self.slices / (2*math.pi)).astype(int) % self.slices
+
+    def lookup(self, x, y, alpha):
+        """ State of the pose (x, y, alpha), poses outside the grid are FREE """
+        ix = int((x - self.origin[0]) // self.resolution)
+        iy = int((y - self.origin[1]) // self.resolution)
+        if not (0 <= ix < self.shape[0] and 0 <= iy < self.shape[1]): return FREE
+        return self.cells[int(self.slice_of(alpha)), ix, iy]
+
+    def lookup_batch(self, poses):
+        """ States of the (N, 3) poses """
+        poses  = np.asarray(poses, float).reshape(-1, 3)
+        idx    = np.floor((poses[:,:2] - self.origin) / self.resolution).astype(int)
+        inside = (idx >= 0).all(1) & (idx < self.shape).all(1)
+        states = np.full(len(poses), FREE, np.uint8)
+        states[inside] = self.cells[self.slice_of(poses[inside,2]), idx[inside,0], idx[inside,1]]
+        return states
+
+    nbytes = property(lambda self: self.cells.nbytes)
+
+    def save(self, path, key=''):
+        np.savez_compressed(path, cells=self.cells, origin=self.origin, resolution=self.resolution,
+                            half_extents=self.half_extents, margin=self.margin, key=key)
+
+    @classmethod
+    def load(cls, path, key=None):
+        """ Slices saved at 'path', None if missing or saved under another key """
+        if not os.path.exists(path): return None
+        with np.load(path) as data:
+            if key is not None and str(data['key']) != key: return None
+            self = cls.__new__(cls)
+            self.cells        = data['cells']
+            self.origin       = data['origin']
+            self.resolution   = float(data['resolution'])
+            self.half_extents = tuple(map(float, data['half_extents']))
+            self.margin       = float(data['margin'])
+        self.slices, self.shape = self.cells.shape[0], self.cells.shape[1:]
+        return self
+
+def cached(obstacles, obstacle_path, half_extents, slices=36, resolution=2.):
+    """ C-space slices of the world read from obstacle_path, built once and cached next to
+    it. The cache is rebuilt when the world file or any parameter changes """
+    with open(obstacle_path, 'rb') as f: digest = hashlib.sha1(f.read()).hexdigest()
+    key   = "%s %s %d %g"%(digest, tuple(map(float, half_extents)), slices, resolution)
+    cache = "%s.cspace.npz"%obstacle_path
+    cs    = CSpaceSlices.load(cache, key)
+    if cs is None:
+        cs = CSpaceSlices(obstacles, half_extents, slices, resolution)
+        try:
+            cs.save(cache, key)
+        except OSError:
+            pass # Read-only location, the slices are still used for this run
+    return cs
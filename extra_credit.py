@@ -1,43 +1,94 @@
 from __future__ import division
 
 import math
+import time
 import numpy as np
 
-from KDTree    import KDTree
-from obstacles import Obstacles
-from utilities import gen_next
+from KDTree    import SE2KDTree
+from obstacles import Obstacles, segments_intersect
+from occupancy import FREE, OCCUPIED
+from plotters  import NullPlotter
+from samplers  import GOAL_BIAS, UniformSampler, take_goal
+from stats     import NULL_STATS, TimedObserver, restores_stats
+from utilities import gen_next, PathTree, PlannerResult
 
 init_t = math.atan(2.5)
 r      = math.hypot(10, 25)
 thetas = [init_t, math.pi-init_t, math.pi+init_t, 2*math.pi-init_t]
+half_extents = (r*math.cos(init_t), r*math.sin(init_t)) # (10, 25) at heading 0
+wrap   = lambda angle: (angle + math.pi) % (2*math.pi) - math.pi
 def gen_rect_pts(x, y, alpha):
     return [(x+r*math.cos(theta+alpha), y+r*math.sin(theta+alpha))
                for theta in thetas]
 
-def _check_collision(obstacles, verts):
-    """ For each side of the rectangle, check if it intersects an obstacle """ 
-    for side in range(4):
-        if obstacles.check_collisions((verts[side], verts[(side+1)%4])):
-            return True
-    return False
-
-def check_collision(obstacles, start, end, distance):
-    # Check for collision every 5 units translation or every 10 degrees rotation
-    steps      = max(int(distance/5), int(abs(end[-1]-start[-1])/math.radians(10)))
-    x,  y,  a  = start
-    x2, y2, a2 = end
-
-    final_state = gen_rect_pts(x2, y2, a2)
-    if _check_collision(obstacles, final_state): return True
-    
-    if steps == 0: return False
-    dx, dy, da = (x2-x)/steps, (y2-y)/steps, (a2-a)/steps
-
-    for i in range(steps):
-        x, y, a = x+dx, y+dy, a+da
-        new_rect = gen_rect_pts(x, y, a)
-        if _check_collision(obstacles, new_rect): return True
-    return False
+corners = r * np.exp(1j * np.array(thetas)) # Corner offsets as complex numbers
+
+def footprints(start, end, steps):
+    """ Corners (steps, 4) as complex numbers x+iy of the rectangle at the poses
+    interpolated from pose start (excluded) to pose end (included) in 'steps' steps """
+    t      = np.arange(1, steps+1) / steps
+    center = complex(*start[:2]) + t * complex(end[0]-start[0], end[1]-start[1])
+    return center[:,None] + np.exp(1j * (start[2] + t*(end[2]-start[2])))[:,None] * corners
+
+def poses_are_valid(obstacles, poses):
+    """ Boolean mask of which of the (N, 3) poses place the rectangle in Q_free, the same
+    test as for the poses of a motion: the center is free and no side crosses an edge """
+    poses = np.asarray(poses, float).reshape(-1, 3)
+    rect  = (poses[:,0] + 1j*poses[:,1])[:,None] + np.exp(1j * poses[:,2])[:,None] * corners
+    sides = np.stack([rect, np.roll(rect, -1, 1)], 2).ravel()
+    hits  = obstacles.check_collisions_batch(np.c_[sides.real, sides.imag].reshape(-1, 2, 2))
+    return obstacles.point_is_valid_batch(poses[:,:2]) & ~hits.reshape(-1, 4).any(1)
+
+def check_collision(obstacles, start, end, distance, cspace=None):
+    """ Whether the rectangle hits an obstacle edge moving from pose start to pose end,
+    checked every 5 units translation or every 10 degrees rotation. With precomputed
+    C-space slices, the poses are looked up there first and only tested exactly if
+    none collides for sure and some are not certainly free """
+    steps = max(int(distance/5), int(abs(end[-1]-start[-1])/math.radians(10)), 1)
+    start, end = np.asarray(start, float), np.asarray(end, float)
+
+    if cspace is not None:
+        t      = np.arange(1, steps+1) / steps
+        states = cspace.lookup_batch(start + t[:,None] * (end - start))
+        if (states == OCCUPIED).any(): return True
+        if (states == FREE).all():     return False
+        obstacles.stats.count('cspace_fallbacks')
+
+    # Most rejected motions end in collision, the final pose alone is cheaper to test
+    return _check_sweep(obstacles, end, end, 1) or _check_sweep(obstacles, start, end, steps)
+
+def _check_sweep(obstacles, start, end, steps, leaf_steps=16):
+    """ Tests the footprints of a sweep against the obstacle edges overlapping its bounding
+    box. Sweeps with no edge in their box are free, long ones are split in two first """
+    lo    = np.minimum(start[:2], end[:2]) - r
+    hi    = np.maximum(start[:2], end[:2]) + r
+    edges = obstacles.edges_in_box(lo, hi)
+    if len(edges) == 0: return False
+
+    if steps > leaf_steps:
+        half = steps // 2
+        mid  = start + (end - start) * (half / steps)
+        return _check_sweep(obstacles, start, mid, half) or _check_sweep(obstacles, mid, end, steps - half)
+
+    rect  = footprints(start, end, steps)
+    p, q  = rect.ravel()[:,None], rect[:, [1, 2, 3, 0]].ravel()[:,None]
+    a, b  = (obstacles.edges[edges] @ np.array([1, 1j])).T
+    if obstacles.stats.enabled:
+        obstacles.stats.count('segment_checks', p.size)
+        obstacles.stats.count('edges_tested', p.size * len(edges))
+
+    # Orientation test with cross(u, v) = Im(conj(u) v), as in Obstacles.check_collisions
+    ab, pq = np.conj(b - a), np.conj(q - p)
+    d1, d2 = (ab * (p - a)).imag, (ab * (q - a)).imag
+    d3, d4 = (pq * (a - p)).imag, (pq * (b - p)).imag
+    s12, s34 = d1*d2, d3*d4
+    if ((s12 < 0) & (s34 < 0)).any(): return True
+    i, j = np.nonzero((s12 <= 0) & (s34 <= 0))
+    if not len(i): return False
+
+    # Touching or collinear, where disjoint segments pass too: the shared kernel decides
+    real = lambda z: np.stack([z.real, z.imag], -1)
+    return bool(segments_intersect(real(p[i,0]), real(q[i,0]), real(a[j]), real(b[j])).any())
 
 def plot_steps(start, end, distance, plotter):
     steps      = int(distance/10)+1
@@ -58,35 +109,52 @@ def plot_steps(start, end, distance, plotter):
     plotter.draw_circle((x2,y2), 4, facecolor='w', edgecolor='k', zorder=5)
     plotter.draw_line(start, (x2,y2), color='k', zorder=4)
 
-def run(obstacles, start, goal, max_size, plotter):
+@restores_stats
+def plan(obstacles, start, goal, max_size, observer=None, rng=None, stats=None, cspace=None, sampler=None,
+         goal_bias=GOAL_BIAS):
+    """ Grows a RRT of rectangle poses until the goal pose is reachable, reporting progress
+    to 'observer' and the time spent in each phase to 'stats'. Motions are checked against
+    the C-space slices 'cspace' (see cspace.py) when given. Samples are drawn from
+    sampler(obstacles, rng=rng, footprint=...) given the rectangle test poses_are_valid,
+    positions get a uniform heading. The goal pose is drawn with probability goal_bias """
+    observer    = observer if observer is not None else NullPlotter()
+    rng         = rng if rng is not None else np.random
+    stats       = stats if stats is not None else NULL_STATS
+    timed       = stats.enabled # The phases of the search loop are only timed if set
+    if timed: observer = TimedObserver(observer, stats)
+    t_start     = time.perf_counter()
     step_size   = 50
     final_pos   = np.array(goal[:2])
     
-    # Pre-compute for generating new random points in Q_free
-    minp, maxp   = obstacles.vertices.min(0), obstacles.vertices.max(0)
-    span, offset = (maxp-minp)*1.1, minp-(maxp-minp)*0.05
-
-    def gen_valid_rand(valid_function):
-        """ Generates a valid q_rand in Q_free given a validity function """
-        tmp     = np.random.random(2) * span + offset
-        while not valid_function(*tmp):
-            tmp = np.random.random(2) * span + offset
-        return tmp
-
-    KD    = KDTree(start[:2], 0)
-    circ1 = plotter.draw_circle(start, 1, time=1, zorder=5)
-    obstacles = Obstacles(obstacles.to_polygons())
-
-    trials = 0
+    # Rotations are weighted by the footprint radius, i.e. the distance its corners travel
+    KD    = SE2KDTree(start[:2], start[2], weight=r)
+    RRT   = PathTree(tuple(start))
+    circ1 = observer.draw_circle(start, 1, time=1, zorder=5)
+    if not isinstance(obstacles, Obstacles): obstacles = Obstacles(obstacles.to_polygons())
+    sampler   = UniformSampler(obstacles, rng=rng) if sampler is None else \
+                    sampler(obstacles, rng=rng, footprint=lambda poses: poses_are_valid(obstacles, poses))
+    t_search  = time.perf_counter()
+    obstacles.stats = stats
+
+    trials, found = 0, False
     while KD.length < max_size:
         trials += 1
         circ1.remove()
-        # Select a random point q_rand \in Q_free
-        q_rand = gen_valid_rand(obstacles.point_is_valid) if np.random.randint(0, 100)>5 else final_pos
-        circ1 = plotter.draw_circle(q_rand, 5, time=0.01, zorder=5)
+        # Select a random pose q_rand \in Q_free
+        if timed: t0 = time.perf_counter()
+        if take_goal(rng, goal_bias):
+            q_rand, alpha_rand = final_pos, goal[2]
+        else:
+            q_rand = sampler.sample()
+            q_rand, alpha_rand = q_rand[:2], q_rand[2] if len(q_rand) > 2 else rng.random_sample() * 2*math.pi
+        if timed: stats.add('sample', t0)
+        circ1 = observer.draw_circle(q_rand, 5, time=0.01, zorder=5)
 
-        # Find the nearest node and distance to it
-        q_near, dist = KD.nearestNode(q_rand, return_node=True)
+        # Find the nearest node in SE(2) and the translation to it
+        if timed: t0 = time.perf_counter()
+        q_near, _ = KD.nearestNode(q_rand, alpha_rand, return_node=True)
+        if timed: stats.add('nearest', t0)
+        dist      = math.hypot(q_rand[0]-q_near[0], q_rand[1]-q_near[1])
 
         # Generate the next node in the direction of q_rand
         if dist < 0.5: continue
@@ -95,29 +163,57 @@ def run(obstacles, start, goal, max_size, plotter):
             q_next = tuple(q_rand)
         else:
             q_next = gen_next(tuple(q_near.node), q_rand, step_size)
-            if not obstacles.point_is_valid(*q_next): continue
+            if timed: t0 = time.perf_counter()
+            valid = obstacles.point_is_valid(*q_next)
+            if timed: stats.add('point_check', t0)
+            if not valid: continue
         
         dist = math.hypot(q_next[0]-q_near[0], q_next[1]-q_near[1])
-        # Check validity and update tree
+        # Check validity and update tree, trying the sampled heading first. Headings are kept
+        # within pi of the parent's so the motion rotates the short way round
         for i in range(10):
-            alpha_new = np.random.random() * 2*math.pi #( + q_near.alpha) - math.pi
-            collides = check_collision(obstacles, (*q_near.node, q_near.alpha), (*q_next, alpha_new), dist)
+            alpha_new = alpha_rand if i == 0 else rng.random_sample() * 2*math.pi
+            alpha_new = q_near.alpha + wrap(alpha_new - q_near.alpha)
+            if timed: t0 = time.perf_counter()
+            collides = check_collision(obstacles, (*q_near.node, q_near.alpha), (*q_next, alpha_new), dist, cspace)
+            if timed: stats.add('collision', t0)
             if not collides: break
         else: continue
         
+        if timed: t0 = time.perf_counter()
         KD.addNode(q_next, alpha_new)
-        plot_steps((*q_near.node, q_near.alpha), (*q_next, alpha_new), dist, plotter)
+        RRT.addPath((*q_near.node, q_near.alpha), (*q_next, alpha_new))
+        if timed: stats.add('insert', t0)
+        plot_steps((*q_near.node, q_near.alpha), (*q_next, alpha_new), dist, observer)
 
         goal_distance = math.hypot(q_next[0]-goal[0], q_next[1]-goal[1]) 
-        collides = check_collision(obstacles, (*q_next, alpha_new), goal, goal_distance)
+        goal_pose     = (*goal[:2], alpha_new + wrap(goal[2] - alpha_new))
+        if timed: t0 = time.perf_counter()
+        collides = check_collision(obstacles, (*q_next, alpha_new), goal_pose, goal_distance, cspace)
+        if timed: stats.add('goal_line', t0)
         if not collides:
-            plot_steps((*q_next, alpha_new), goal, goal_distance, plotter)
-            plotter.draw_rectangle(gen_rect_pts(*goal), facecolor='red', edgecolor='k')
+            RRT.addPath((*q_next, alpha_new), tuple(goal))
+            plot_steps((*q_next, alpha_new), goal_pose, goal_distance, observer)
+            observer.draw_rectangle(gen_rect_pts(*goal), facecolor='red', edgecolor='k')
+            found = True
             break
 
         trials = 0
 
-    print("n =", KD.length)
+    t_end   = time.perf_counter()
+    stats.count('samples_drawn', sampler.drawn)
+    stats.count('samples_rejected', sampler.rejected)
+    stats.count('kd_rebuilds', KD.rebuilds)
+    timings = {'setup': t_search-t_start, 'search': t_end-t_search, 'total': t_end-t_start}
+    path    = RRT.pathTo(tuple(goal)) if found else None
+    return PlannerResult(path, RRT, KD.length, timings)
+
+def run(obstacles, start, goal, max_size, plotter=None, stats=None, cspace=None, sampler=None,
+        goal_bias=GOAL_BIAS):
+    result = plan(obstacles, start, goal, max_size, plotter, stats=stats, cspace=cspace, sampler=sampler,
+                  goal_bias=goal_bias)
+    print("n =", result.n)
+    return result
 
 if __name__ == '__main__':
     from ImageGenerator import ImageGenerator
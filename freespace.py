@@ -0,0 +1,141 @@
+from __future__ import division
+
+import os
+import hashlib
+import numpy as np
+
+from obstacles import segments_intersect
+from samplers  import sampling_box
+from spatial   import EdgeGrid
+
+def _crossings(obstacles):
+    """ x of every point where two obstacle edges cross """
+    edges = obstacles.edges
+    index = obstacles.index if obstacles.index is not None else EdgeGrid(edges)
+    p, q  = edges[:,0], edges[:,1]
+    xs    = [np.zeros(0)]
+    step  = max(1, obstacles.batch_size // 64)
+    for i in range(0, len(edges), step):
+        seg, edge = index.segment_pairs(p[i:i+step], q[i:i+step])
+        seg   = seg + i
+        pairs = np.unique(np.stack([seg, edge], 1)[seg < edge], axis=0)
+        a, b  = pairs.T
+        pairs = pairs[segments_intersect(p[a], q[a], p[b], q[b])]
+        a, b  = pairs.T
+        d1, d2 = q[a] - p[a], q[b] - p[b]
+        den   = d1[:,0]*d2[:,1] - d1[:,1]*d2[:,0]
+        ok    = den != 0 # Collinear overlaps start and end at vertices
+        w     = p[b] - p[a]
+        t     = (w[ok,0]*d2[ok,1] - w[ok,1]*d2[ok,0]) / den[ok]
+        xs.append(p[a[ok],0] + t*d1[ok,0])
+    return np.concatenate(xs)
+
+class Trapezoids:
+    """ Vertical decomposition of Q_free within 'box' (the UniformSampler box by default).
+
+    The box is cut into vertical slabs at the x of every obstacle vertex and every edge
+    crossing. The edges passing through a slab never cross inside it, so they split it
+    into trapezoids that are entirely free or occupied. Going up a slab, the edges of a
+    polygon alternately enter and leave it, so a trapezoid is free if every polygon entered
+    below it was left again. The free trapezoids, merged with their continuation in the
+    next slab, are sampled with probability proportional to their area: every sample is
+    valid by construction """
+    def __init__(self, obstacles, box=None):
+        lo, hi = box if box is not None else sampling_box(obstacles)
+        keep   = obstacles.edges[:,0,0] != obstacles.edges[:,1,0]
+        edges, owner = obstacles.edges[keep], obstacles._owner[keep]
+        edges  = np.where((edges[:,0,0] > edges[:,1,0])[:,None,None], edges[:,::-1], edges)
+        X = np.unique(np.r_[lo[0], hi[0], obstacles.edges[...,0].ravel(), _crossings(obstacles)])
+        X = X[(X >= lo[0]) & (X <= hi[0])]
+        S = len(X) - 1
+
+        # (slab, edge) pairs with the heights of the edge at both sides of the slab
+        first = np.searchsorted(X, edges[:,0,0])
+        n     = np.searchsorted(X, edges[:,1,0]) - first
+        eid   = np.repeat(np.arange(len(edges)), n)
+        slab  = np.repeat(first - np.cumsum(n) + n, n) + np.arange(n.sum())
+        (x0, y0), (x1, y1) = edges[eid,0].T, edges[eid,1].T
+        yl = y0 + (X[slab] - x0) / (x1 - x0) * (y1 - y0)
+        yr = y0 + (X[slab+1] - x0) / (x1 - x0) * (y1 - y0)
+
+        # The bottom and top of the box close every slab, as edges -1 and -2
+        own  = np.r_[owner[eid], np.full(2*S, -1)]
+        eid  = np.r_[eid, np.full(S, -1), np.full(S, -2)]
+        slab = np.r_[slab, np.arange(S), np.arange(S)]
+        yl   = np.r_[yl, np.full(S, lo[1]), np.full(S, hi[1])]
+        yr   = np.r_[yr, np.full(S, lo[1]), np.full(S, hi[1])]
+        ym   = (yl + yr) / 2
+
+        # Even crossings of a polygon within a slab enter it, odd ones leave it
+        order = np.lexsort((ym, own, slab))
+        group = np.r_[True, (slab[order[1:]] != slab[order[:-1]]) | (own[order[1:]] != own[order[:-1]])]
+        rank  = np.arange(len(order)) - np.maximum.accumulate(np.where(group, np.arange(len(order)), 0))
+        enter = np.empty(len(order), int)
+        enter[order] = np.where(own[order] < 0, 0, 1 - 2*(rank % 2))
+
+        # Consecutive edges within a slab bound a trapezoid, free if no polygon is entered
+        order = np.lexsort((ym, slab))
+        depth = np.cumsum(enter[order])
+        same  = slab[order[1:]] == slab[order[:-1]]
+        free  = same & (depth[:-1] == 0)
+        a, b  = order[:-1][free], order[1:][free]
+        a, b  = a[ym[b] > ym[a]], b[ym[b] > ym[a]]
+        s     = slab[a]
+
+        # Merge the trapezoids continuing in the next slab between the same two edges
+        order = np.lexsort((s, eid[b], eid[a]))
+        a, b, s = a[order], b[order], s[order]
+        start = np.flatnonzero(np.r_[True, (eid[a[1:]] != eid[a[:-1]]) | (eid[b[1:]] != eid[b[:-1]]) |
+                                           (s[1:] != s[:-1] + 1)])
+        end   = np.r_[start[1:], len(s)] - 1
+        self.traps = np.c_[X[s[start]], X[s[end]+1], yl[a[start]], yr[a[end]], yl[b[start]], yr[b[end]]]
+        self.box   = (np.asarray(lo, float), np.asarray(hi, float))
+        self._setup()
+
+    def _setup(self):
+        x0, x1, l0, l1, h0, h1 = self.traps.T
+        self._cum = np.cumsum((x1 - x0) * ((h0 - l0) + (h1 - l1)) / 2)
+        self.area = float(self._cum[-1]) if len(self._cum) else 0.
+
+    def __len__(self): return len(self.traps)
+
+    def sample(self, n, rng=np.random):
+        """ (n, 2) uniform samples of Q_free within the box """
+        k = np.minimum(np.searchsorted(self._cum, rng.random_sample(n) * self.area, 'right'), len(self) - 1)
+        x0, x1, l0, l1, h0, h1 = self.traps[k].T
+        w0, w1 = h0 - l0, h1 - l1
+
+        # Inverse CDF of the position across the trapezoid, whose height varies linearly
+        u = rng.random_sample(n)
+        t = u * (w0 + w1) / np.maximum(w0 + np.sqrt(w0*w0 + u*(w1*w1 - w0*w0)), 1e-300)
+        y_lo, y_hi = l0 + t*(l1 - l0), h0 + t*(h1 - h0)
+        return np.c_[x0 + t*(x1 - x0), y_lo + rng.random_sample(n) * (y_hi - y_lo)]
+
+    def save(self, path, key=''):
+        np.savez_compressed(path, traps=self.traps, lo=self.box[0], hi=self.box[1], key=key)
+
+    @classmethod
+    def load(cls, path, key=None):
+        """ Decomposition saved at 'path', None if missing or saved under another key """
+        if not os.path.exists(path): return None
+        with np.load(path) as data:
+            if key is not None and str(data['key']) != key: return None
+            self = cls.__new__(cls)
+            self.traps = data['traps']
+            self.box   = (data['lo'], data['hi'])
+        self._setup()
+        return self
+
+def cached(obstacles, obstacle_path):
+    """ Decomposition of the free space of the world read from obstacle_path, built once
+    and cached next to it. The cache is rebuilt when the world file changes """
+    with open(obstacle_path, 'rb') as f: key = hashlib.sha1(f.read()).hexdigest()
+    cache = "%s.free.npz"%obstacle_path
+    traps = Trapezoids.load(cache, key)
+    if traps is None:
+        traps = Trapezoids(obstacles)
+        try:
+            traps.save(cache, key)
+        except OSError:
+            pass # Read-only location, the decomposition is still used for this run
+    return traps
@@ -5,12 +5,16 @@ import numpy as np
 from matplotlib.path import Path
 
 from obstacles         import Obstacles
-from ImageGenerator    import ImageGenerator
+from samplers          import GOAL_BIAS, from_spec
+from stats             import NULL_STATS, Stats
 from utilities         import get_obstacle_course, get_start_and_goal
 
 from unidirectionalrrt import run as RRT
 from bidirectionalrrt  import run as BRRT
 from extra_credit      import run as EXTRA
+from rrtstar           import run as RRTSTAR
+from prm               import run as PRM
+from portfolio         import run as PORTFOLIO
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -18,33 +22,137 @@ if __name__ == '__main__':
             epilog="- Pranav Shrestha (ps2958), Greyson Barrera (gmb2167)",
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-m", "--mode", default="unidirectional", 
-                            choices=["unidirectional", "bidirectional", "extra"],
+                            choices=["unidirectional", "bidirectional", "extra", "rrtstar", "prm"],
                             help="RRT mode")
 
     parser.add_argument("--step-size",  metavar="step_size", default=50, type=int,
-                            help="Step size for uni/bi-directional RRT")
+                            help="Step size for uni/bi-directional RRT and RRT*")
     parser.add_argument("--max-search", metavar="max_search", default=2000, type=int,
-                            help="Max number of nodes to expand RRT")
+                            help="Max number of nodes to expand RRT (number of roadmap nodes for PRM)")
     parser.add_argument("--obstacle-path", metavar="obstacle_path", default="world_obstacles.txt",
                             help="Obstacle filepath")
     parser.add_argument("--goal-path", metavar="goal_path", default="start_goal.txt",
                             help="Start/Goal filepath")
+    parser.add_argument("--lazy", action="store_true",
+                            help="Unidirectional RRT only checks the edges of candidate paths for collisions")
+    parser.add_argument("--sampler", metavar="sampler", default="uniform",
+                            help="Sampler of Q_free: uniform, gaussian, bridge or a mixture like uniform:0.5,bridge:0.5")
+    parser.add_argument("--sigma", metavar="sigma", default=20., type=float,
+                            help="Spread of the gaussian and bridge samplers")
+    parser.add_argument("--goal-bias", metavar="goal_bias", default=GOAL_BIAS, type=float,
+                            help="Share of samples drawn at the goal, in steps of 0.01")
+    parser.add_argument("--grid-resolution", metavar="grid_resolution", default=None, type=float,
+                            help="Cell size of the occupancy grid used for point checks (disabled if unset)")
+    parser.add_argument("--index-resolution", metavar="index_resolution", default=None, type=float,
+                            help="Cell size of the obstacle edge index (automatic if unset, 0 disables)")
+    parser.add_argument("--world-cache", action="store_true",
+                            help="Load the obstacles from a compiled binary copy of the obstacle file, built on first use")
+    parser.add_argument("--free-space", action="store_true",
+                            help="Sample Q_free from a cached trapezoid decomposition of the world, without rejections")
+    parser.add_argument("--cspace-slices", metavar="cspace_slices", default=0, type=int,
+                            help="Heading slices of the cached C-space bitmaps used by the extra mode (0 disables)")
+    parser.add_argument("--portfolio", metavar="portfolio", default=0, type=int,
+                            help="Number of independently seeded planners to run on a process pool (0 runs one in-process)")
+    parser.add_argument("--budget", metavar="budget", default=None, type=float,
+                            help="Seconds the portfolio may run to return its shortest path (first solution if unset)")
+    parser.add_argument("--shortcut", metavar="shortcut", default=0, type=float,
+                            help="Seconds spent shortcutting the final path (disabled if 0, not for the extra mode)")
+    parser.add_argument("--batch", metavar="batch", default=None,
+                            help="Solve every start/goal pair of this file ('sx sy gx gy' per line) and print JSON lines")
+    parser.add_argument("--batch-output", metavar="batch_output", default=None,
+                            help="Write the batch results to this file instead of stdout")
+    parser.add_argument("--workers", metavar="workers", default=None, type=int,
+                            help="Processes solving the batch (CPU count if unset, 0 solves in-process)")
+    parser.add_argument("--timeout", metavar="timeout", default=None, type=float,
+                            help="Seconds after which a batch query is abandoned (no limit if unset)")
+    parser.add_argument("--stats", action="store_true",
+                            help="Print call counts and per-phase timings of the run")
+    parser.add_argument("--stats-json", metavar="stats_json", default=None,
+                            help="Write the call counts and per-phase timings as JSON to this file")
+    parser.add_argument("--headless", action="store_true",
+                            help="Plan without creating a figure or waiting for input")
     
     args = parser.parse_args()
+    try:
+        sampler = from_spec(args.sampler, args.sigma)
+    except ValueError as e:
+        parser.error(str(e))
+    custom  = args.sampler != "uniform" or args.goal_bias != GOAL_BIAS
+    if custom and (args.batch or args.portfolio > 0 or args.mode == "prm"):
+        parser.error("--sampler and --goal-bias are not supported by --batch, --portfolio and the prm mode")
+
+    if args.world_cache:
+        import worldcache
+        world    = worldcache.load_world(args.obstacle_path, args.grid_resolution, args.index_resolution)
+    else:
+        world    = Obstacles(get_obstacle_course(args.obstacle_path).to_polygons(),
+                             args.grid_resolution, args.index_resolution)
+    if args.free_space:
+        import freespace
+        world.free_space = freespace.cached(world, args.obstacle_path)
+
+    if args.batch:
+        import batch
+        mode    = "lazy" if args.lazy and args.mode == "unidirectional" else args.mode
+        try:
+            queries = batch.read_queries(args.batch, args.mode)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        roadmap = None
+        if mode == "prm":
+            import prm
+            roadmap = prm.cached(world, args.obstacle_path, args.max_search)
+        out = open(args.batch_output, 'w') if args.batch_output else sys.stdout
+        try:
+            batch.run(world, queries, mode, args.step_size, args.max_search, roadmap, args.workers,
+                      args.timeout, with_stats=args.stats, out=out)
+        finally:
+            if out is not sys.stdout: out.close()
+        sys.exit(0)
 
-    obstacles    = get_obstacle_course(args.obstacle_path)
     start, goal  = (75., 50., 0.), (482.,577.,math.pi/2)
     if args.mode != "extra": start, goal = get_start_and_goal(args.goal_path)
 
-    plotter    = ImageGenerator()
-    plotter.draw_obstacle_course(obstacles)
-    plotter.draw_start_and_goal(start,goal)
+    stats   = Stats() if args.stats or args.stats_json else None
+    plotter = None
+    if not args.headless:
+        from ImageGenerator import ImageGenerator
+        plotter    = ImageGenerator()
+        plotter.draw_obstacle_course(get_obstacle_course(args.obstacle_path))
+        plotter.draw_start_and_goal(start,goal)
 
-    if args.mode == "unidirectional":
-        RRT(obstacles, start, goal, args.step_size, args.max_search, plotter)
+    if args.portfolio > 0:
+        mode   = "lazy" if args.lazy and args.mode == "unidirectional" else args.mode
+        result = PORTFOLIO(world, start, goal, args.step_size, args.max_search, mode,
+                           args.portfolio, args.budget, plotter, stats)
+    elif args.mode == "unidirectional":
+        result = RRT(world, start, goal, args.step_size, args.max_search, plotter, stats, args.lazy,
+                     sampler, args.goal_bias)
     elif args.mode =="bidirectional":
-        BRRT(obstacles, start, goal, args.step_size, args.max_search, plotter)
+        result = BRRT(world, start, goal, args.step_size, args.max_search, plotter, stats, sampler, args.goal_bias)
+    elif args.mode == "rrtstar":
+        result = RRTSTAR(world, start, goal, args.step_size, args.max_search, plotter, stats, sampler,
+                         args.goal_bias)
+    elif args.mode == "prm":
+        import prm
+        roadmap = prm.cached(world, args.obstacle_path, args.max_search)
+        result  = PRM(world, start, goal, args.max_search, plotter, stats, roadmap)
     else:
-        EXTRA(obstacles, start, goal, args.max_search, plotter)
+        slices = None
+        if args.cspace_slices > 0:
+            import cspace, extra_credit
+            slices = cspace.cached(world, args.obstacle_path, extra_credit.half_extents, args.cspace_slices)
+        result = EXTRA(world, start, goal, args.max_search, plotter, stats, slices, sampler, args.goal_bias)
 
-    input("Press enter to exit : ")
\ No newline at end of file
+    if args.shortcut > 0 and result.success and args.mode != "extra":
+        import smoothing
+        smoothing.run(world, result, args.shortcut, plotter, stats=stats or NULL_STATS)
+
+    if args.stats:      print(stats)
+    if args.stats_json: stats.to_json(args.stats_json)
+
+    if args.headless:
+        print(result)
+        if world.index is not None: print("index :", world.index.stats())
+    else:
+        input("Press enter to exit : ")
\ No newline at end of file
@@ -1,4 +1,46 @@
 from __future__ import division
+import numpy as np
+
+from occupancy import OccupancyGrid, FREE, BOUNDARY
+from spatial   import EdgeGrid
+from stats     import NULL_STATS
+
+def _orient(o, a, b):
+    """ Twice the signed area of the triangle (o, a, b) for arrays of shape (..., 2) """
+    return (a[...,0]-o[...,0])*(b[...,1]-o[...,1]) - (a[...,1]-o[...,1])*(b[...,0]-o[...,0])
+
+def segments_intersect(p, q, a, b):
+    """ Orientation based intersection test between segments pq and ab. Endpoints are
+    arrays of shape (..., 2) and are broadcast against each other. Touching and
+    overlapping collinear segments count as intersecting """
+    d1, d2 = _orient(a, b, p), _orient(a, b, q)
+    d3, d4 = _orient(p, q, a), _orient(p, q, b)
+
+    # Bounding box overlap rejects the collinear but disjoint case
+    overlap = (np.minimum(p[...,0], q[...,0]) <= np.maximum(a[...,0], b[...,0])) & \
+              (np.minimum(a[...,0], b[...,0]) <= np.maximum(p[...,0], q[...,0])) & \
+              (np.minimum(p[...,1], q[...,1]) <= np.maximum(a[...,1], b[...,1])) & \
+              (np.minimum(a[...,1], b[...,1]) <= np.maximum(p[...,1], q[...,1]))
+    return (d1*d2 <= 0) & (d3*d4 <= 0) & overlap
+
+def points_in_polygons(points, e0, e1, starts, tol=1e-6):
+    """ Vectorized crossing-number test of (N, 2) points against polygons whose edges
+    (e0[i], e1[i]) are stored contiguously, polygon j starting at edge starts[j].
+    Returns a mask of the points inside, or within 'tol' of the boundary of, any polygon """
+    px, py = points[:,0,None], points[:,1,None]
+    x0, y0, x1, y1 = e0[:,0], e0[:,1], e1[:,0], e1[:,1]
+
+    # Count crossings of the ray from each point towards +x, parity taken per polygon
+    orient = (x1-x0)*(py-y0) - (y1-y0)*(px-x0)
+    cross  = ((y0 > py) != (y1 > py)) & (orient*(y1-y0) > 0)
+    inside = np.logical_xor.reduceat(cross, starts, axis=1).any(1)
+
+    # Points on an edge count as inside
+    length  = np.hypot(x1-x0, y1-y0)
+    on_edge = (np.abs(orient) <= tol*length) & \
+              (np.minimum(x0, x1)-tol <= px) & (px <= np.maximum(x0, x1)+tol) & \
+              (np.minimum(y0, y1)-tol <= py) & (py <= np.maximum(y0, y1)+tol)
+    return inside | on_edge.any(1)
 
 class Range:
     """ Represents a Range (min, max) given a series of values """
@@ -98,20 +140,200 @@ class Obstacle:
 
 class Obstacles:
     """ Container object for obstacles """
-    def __init__(self, obstacles):
-        self.obss = [Obstacle([tuple(pt.astype(int)) for pt in vertices]) for vertices in obstacles]
+    batch_size      = 1 << 20 # Max number of segment/edge pairs tested at once
+    index_threshold = 256     # Min number of edges for building the edge index by default
+    stats           = NULL_STATS # Query counters, set by the planners while they run
+    free_space      = None       # Optional freespace.Trapezoids sampled by UniformSampler
+
+    def __init__(self, obstacles, grid_resolution=None, index_resolution=None):
+        # All obstacle edges compiled into contiguous (E, 2, 2) endpoint arrays. The edges
+        # of each closed vertex loop are the consecutive vertex pairs within it
+        polygons = [np.asarray(vertices).astype(int).astype(float) for vertices in obstacles]
+        sides    = np.array([len(v)-1 for v in polygons], int)
+        points   = np.concatenate(polygons) if polygons else np.zeros((0, 2))
+        first    = np.cumsum(sides + 1) - sides - 1
+        idx      = np.repeat(first, sides) + np.arange(sides.sum()) - np.repeat(np.cumsum(sides) - sides, sides)
+        self._setup(np.stack([points[idx], points[idx+1]], 1), np.cumsum(sides) - sides)
+
+        # Spatial index over edges, by default only for worlds large enough to benefit.
+        # index_resolution=0 disables it, any other value sets the cell size
+        self.index = None
+        if index_resolution or (index_resolution is None and len(self.edges) >= self.index_threshold):
+            self.index = EdgeGrid(self.edges, index_resolution)
+
+        # Optional occupancy bitmap answering most point queries in constant time
+        self.grid = None
+        if grid_resolution: self.grid = OccupancyGrid(self, grid_resolution)
+
+    @classmethod
+    def from_arrays(cls, edges, starts, index=None, grid=None, cols=None, bounds=None):
+        """ Obstacles from the (E, 2, 2) edge array, in which the edges of polygon i start at
+        starts[i], and optionally a prebuilt EdgeGrid, OccupancyGrid, per-edge columns and
+        bounds, as stored by worldcache.py. The legacy Obstacle objects are only built if needed """
+        self = cls.__new__(cls)
+        self._setup(edges, starts, cols, bounds)
+        self.index, self.grid = index, grid
+        return self
+
+    def _setup(self, edges, starts, cols=None, bounds=None):
+        self.edges   = np.asarray(edges, float).reshape(-1, 2, 2)
+        self._starts = np.asarray(starts, int)
+        self._e0, self._e1 = self.edges[:,0], self.edges[:,1]
+        self._owner  = np.repeat(np.arange(len(self._starts)), np.diff(np.r_[self._starts, len(self.edges)]))
+        if bounds is None:
+            bounds = (self.edges.reshape(-1, 2).min(0), self.edges.reshape(-1, 2).max(0)) \
+                        if len(self.edges) else (np.zeros(2), np.zeros(2))
+        self.bounds  = tuple(np.asarray(b, float) for b in bounds)
+        self._obss   = None
+
+        # Per-edge columns and bounding boxes for the single segment query
+        if cols is None:
+            x0, y0, x1, y1 = self.edges.reshape(-1, 4).T
+            cols = np.stack([x0, y0, x1, y1, np.minimum(x0, x1), np.maximum(x0, x1),
+                             np.minimum(y0, y1), np.maximum(y0, y1), np.hypot(x1-x0, y1-y0)], 1)
+        self._cols = cols
+        (self._x0, self._y0, self._x1, self._y1, self._xmin, self._xmax,
+         self._ymin, self._ymax, self._length) = cols.T.copy() # Contiguous for the full scans
+
+    @property
+    def obss(self):
+        """ Legacy Obstacle objects, built on first use """
+        if self._obss is None:
+            ends = np.r_[self._starts[1:], len(self.edges)]
+            self._obss = [Obstacle([tuple(v) for v in self._e0[s:e].astype(int)] + [tuple(self._e1[e-1].astype(int))])
+                          for s, e in zip(self._starts, ends)]
+        return self._obss
     
     def point_is_valid(self, x, y):
         """ Returns whether or not q=(x,y) is in Q_free """
+        stats = self.stats
+        if stats.enabled: stats.count('point_checks')
+        if self.grid is not None:
+            state = self.grid.lookup(x, y)
+            if state != BOUNDARY:
+                if stats.enabled: stats.count('grid_hits')
+                return state == FREE
+
+        if self.index is not None:
+            return not self._point_in_edges(x, y, self.index.ray_candidates(x, y))
+
         point = Point(x, y)
         for obs in self.obss:
             if obs.point_in_obstacle(point): return False
         return True
 
+    def _point_in_edges(self, x, y, idx, tol=1e-6):
+        """ Crossing-number test of q=(x,y) restricted to the edges 'idx', which must contain
+        every edge touching q or crossing the ray from q towards +x (duplicates allowed) """
+        x0, y0, x1, y1, xmin, xmax, ymin, ymax, length = self._cols[idx].T
+        orient = (x1-x0)*(y-y0) - (y1-y0)*(x-x0)
+
+        # Points on an edge are inside
+        near = (xmin-tol <= x) & (x <= xmax+tol) & (ymin-tol <= y) & (y <= ymax+tol)
+        if near.any() and (np.abs(orient[near]) <= tol*length[near]).any(): return True
+
+        # The ray crosses edges straddling y with q on their left (w.r.t. increasing y)
+        cross = ((y0 > y) != (y1 > y)) & (orient*(y1-y0) > 0)
+        if not cross.any(): return False
+        return bool((np.bincount(self._owner[np.unique(idx[cross])]) & 1).any())
+
+    def point_is_valid_batch(self, points):
+        """ Boolean mask of which of the (N, 2) points are in Q_free """
+        points = np.asarray(points, float).reshape(-1, 2)
+        mask   = np.ones(len(points), bool)
+        step   = max(1, self.batch_size // max(1, len(self.edges)))
+        self.stats.count('point_checks', len(points))
+        if len(self.edges) == 0: return mask
+
+        # Only points in boundary cells of the occupancy grid need the exact test
+        exact = np.arange(len(points))
+        if self.grid is not None:
+            states = self.grid.lookup_batch(points)
+            mask   = states == FREE
+            exact  = np.flatnonzero(states == BOUNDARY)
+            self.stats.count('grid_hits', len(points) - len(exact))
+
+        if self.index is None:
+            for i in range(0, len(exact), step):
+                idx = exact[i:i+step]
+                mask[idx] = ~points_in_polygons(points[idx], self._e0, self._e1, self._starts)
+            return mask
+
+        # With the edge index, points are tested against the edges in their grid row only
+        rows = np.array([self.index.row(y) for y in points[exact,1]], int)
+        for row in np.unique(rows):
+            cand   = self.index.row_candidates(row)
+            owner  = self._owner[cand]
+            starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+            sub    = exact[rows == row]
+            step   = max(1, self.batch_size // max(1, len(cand)))
+            self.index.queries, self.index.candidates = \
+                self.index.queries + len(sub), self.index.candidates + len(sub)*len(cand)
+            if len(cand) == 0: continue
+
+            for i in range(0, len(sub), step):
+                idx = sub[i:i+step]
+                mask[idx] = ~points_in_polygons(points[idx], self._e0[cand], self._e1[cand], starts)
+        return mask
+
     def check_collisions(self, line, verbose=False):
-        line = Line(Point(*line[0]), Point(*line[1]))
-        
-        for obs in self.obss:
-            if obs.check_collisions(line, verbose):
-                return True
-        return False
\ No newline at end of file
+        """ Returns whether the segment line=(p, q) intersects any obstacle edge """
+        (px, py), (qx, qy) = line[0][:2], line[1][:2]
+
+        # Only edges whose bounding box overlaps the segment's need the orientation test
+        if self.index is None:
+            candidates = len(self.edges)
+            idx = np.flatnonzero((self._xmax >= min(px, qx)) & (self._xmin <= max(px, qx)) &
+                                 (self._ymax >= min(py, qy)) & (self._ymin <= max(py, qy)))
+        else:
+            idx = self.index.segment_candidates((px, py), (qx, qy))
+            candidates = len(idx)
+            x0, y0, x1, y1, xmin, xmax, ymin, ymax, _ = self._cols[idx].T
+            hit = (xmax >= min(px, qx)) & (xmin <= max(px, qx)) & (ymax >= min(py, qy)) & (ymin <= max(py, qy))
+            idx = idx[hit]
+
+        stats = self.stats
+        if stats.enabled:
+            stats.count('segment_checks')
+            stats.count('bbox_rejected_edges', candidates - len(idx))
+            stats.count('edges_tested', len(idx))
+            if len(idx) == 0: stats.count('bbox_early_outs')
+        if len(idx) == 0: return False
+
+        x0, y0, x1, y1 = self._x0[idx], self._y0[idx], self._x1[idx], self._y1[idx]
+        ex, ey, sx, sy = x1-x0, y1-y0, qx-px, qy-py
+        d1 = ex*(py-y0) - ey*(px-x0)
+        d2 = ex*(qy-y0) - ey*(qx-x0)
+        d3 = sx*(y0-py) - sy*(x0-px)
+        d4 = sx*(y1-py) - sy*(x1-px)
+        return bool(((d1*d2 <= 0) & (d3*d4 <= 0)).any())
+
+    def edges_in_box(self, lo, hi):
+        """ Indices of the edges whose bounding box overlaps the box [lo, hi] """
+        idx = np.arange(len(self.edges)) if self.index is None else self.index.box_candidates(lo, hi)
+        return idx[(self._xmax[idx] >= lo[0]) & (self._xmin[idx] <= hi[0]) &
+                   (self._ymax[idx] >= lo[1]) & (self._ymin[idx] <= hi[1])]
+
+    def check_collisions_batch(self, segments):
+        """ Boolean mask of which of the (N, 2, 2) segments intersect an obstacle edge """
+        segments = np.asarray(segments, float).reshape(-1, 2, 2)
+        mask     = np.zeros(len(segments), bool)
+        step     = max(1, self.batch_size // max(1, len(self.edges)))
+        self.stats.count('segment_checks', len(segments))
+
+        if self.index is None:
+            self.stats.count('edges_tested', len(segments) * len(self.edges))
+            for i in range(0, len(segments), step):
+                p, q = segments[i:i+step, None, 0], segments[i:i+step, None, 1]
+                mask[i:i+step] = segments_intersect(p, q, self._e0, self._e1).any(1)
+            return mask
+
+        # With the edge index, only (segment, edge) pairs sharing a grid cell are tested
+        step = max(1, self.batch_size // 64)
+        for i in range(0, len(segments), step):
+            p, q      = segments[i:i+step, 0], segments[i:i+step, 1]
+            seg, edge = self.index.segment_pairs(p, q)
+            self.stats.count('edges_tested', len(edge))
+            hits      = segments_intersect(p[seg], q[seg], self._e0[edge], self._e1[edge])
+            mask[i:i+step] = np.bincount(seg[hits], minlength=len(p)) > 0
+        return mask
\ No newline at end of file
@@ -0,0 +1,62 @@
+from __future__ import division
+import numpy as np
+
+from spatial import segment_cells
+
+FREE, OCCUPIED, BOUNDARY = 0, 1, 2
+
+class OccupancyGrid:
+    """ Rasterized occupancy bitmap over the obstacle bounding box. Every cell is marked
+    FREE, OCCUPIED or BOUNDARY (an obstacle edge passes through or touches it) so that only
+    points in BOUNDARY cells need the exact polygon test """
+    def __init__(self, obstacles, resolution=5., max_cells=1 << 22, tol=1e-6):
+        minp, maxp = obstacles.bounds
+        extent     = np.maximum(maxp - minp, 1e-9)
+
+        # Coarsen the grid until it fits in the memory budget
+        resolution = float(resolution)
+        while np.prod(np.floor(extent/resolution) + 3) > max_cells: resolution *= 2
+
+        # One cell of padding on every side so points near an edge never fall outside
+        self.resolution = resolution
+        self.origin     = minp.astype(float) - resolution
+        self.shape      = tuple(int(n) for n in np.floor(extent/resolution) + 3)
+        self.cells      = np.zeros(self.shape, np.uint8)
+
+        self._mark_boundary(obstacles.edges, tol)
+
+        # Cells not touched by any edge are entirely inside or outside, the center decides
+        idx     = np.argwhere(self.cells != BOUNDARY)
+        centers = self.origin + (idx + 0.5) * resolution
+        self.cells[tuple(idx.T)] = np.where(obstacles.point_is_valid_batch(centers), FREE, OCCUPIED)
+
+    @classmethod
+    def from_arrays(cls, origin, resolution, cells):
+        """ Grid from the arrays of one built earlier, as stored by worldcache.py """
+        self = cls.__new__(cls)
+        self.resolution, self.origin, self.cells = float(resolution), np.asarray(origin, float), cells
+        self.shape = tuple(cells.shape)
+        return self
+
+    def _mark_boundary(self, edges, tol):
+        """ Marks every cell touched by (or within 'tol' of) an edge """
+        if len(edges) == 0: return
+        _, cells = segment_cells(edges[:,0], edges[:,1], self.origin, self.resolution, self.shape, tol)
+        self.cells[cells % self.shape[0], cells // self.shape[0]] = BOUNDARY
+
+    def lookup(self, x, y):
+        """ State of the cell containing q=(x,y), points outside the grid are FREE """
+        ix = int((x - self.origin[0]) // self.resolution)
+        iy = int((y - self.origin[1]) // self.resolution)
+        if not (0 <= ix < self.shape[0] and 0 <= iy < self.shape[1]): return FREE
+        return self.cells[ix, iy]
+
+    def lookup_batch(self, points):
+        """ States of the cells containing the (N, 2) points """
+        idx    = np.floor((points - self.origin) / self.resolution).astype(int)
+        inside = (idx >= 0).all(1) & (idx < self.shape).all(1)
+        states = np.full(len(points), FREE, np.uint8)
+        states[inside] = self.cells[idx[inside,0], idx[inside,1]]
+        return states
+
+    nbytes = property(lambda self: self.cells.nbytes)
@@ -0,0 +1,56 @@
+class Artist:
+    """ Stand-in for a matplotlib artist returned by the non-rendering plotters """
+    def __init__(self, plotter=None, index=None):
+        self.plotter, self.index = plotter, index
+
+    def remove(self):
+        if self.plotter is not None: self.plotter._record('remove', self.index)
+
+class NullPlotter:
+    """ Plotter with the ImageGenerator interface that discards every call """
+    _artist = Artist()
+
+    def draw_obstacle_course(self, obstacle_path):  pass
+    def draw_start_and_goal(self, start, goal):     pass
+    def update(self, time=0.01):                    pass
+
+    def draw_circle(self, center, radius, time=0.01, update=True, **kwargs):
+        return self._artist
+
+    def draw_line(self, start, end, time=0.01, update=True, **kwargs):
+        return self._artist
+
+    def draw_rectangle(self, vertices, time=0.01, update=True, **kwargs):
+        return self._artist
+
+class RecordingPlotter(NullPlotter):
+    """ Plotter that records every drawing call as an event instead of rendering it
+
+    Each event is a tuple (kind, args, kwargs). Artists returned by the draw calls
+    record a ('remove', (index,), {}) event referring to the event that created them.
+    """
+    def __init__(self):
+        self.events = []
+
+    def _record(self, kind, *args, **kwargs):
+        self.events.append((kind, args, kwargs))
+        return Artist(self, len(self.events)-1)
+
+    def draw_obstacle_course(self, obstacle_path):
+        self._record('obstacle_course', obstacle_path)
+
+    def draw_start_and_goal(self, start, goal):
+        self._record('start_and_goal', start, goal)
+
+    def draw_circle(self, center, radius, time=0.01, update=True, **kwargs):
+        return self._record('circle', tuple(center[:2]), radius, **kwargs)
+
+    def draw_line(self, start, end, time=0.01, update=True, **kwargs):
+        return self._record('line', tuple(start[:2]), tuple(end[:2]), **kwargs)
+
+    def draw_rectangle(self, vertices, time=0.01, update=True, **kwargs):
+        return self._record('rectangle', [tuple(v) for v in vertices], **kwargs)
+
+    def count(self, kind):
+        """ Number of recorded events of the given kind """
+        return sum(1 for event in self.events if event[0] == kind)
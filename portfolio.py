@@ -0,0 +1,113 @@
+from __future__ import division
+
+import time
+import functools
+import multiprocessing as mp
+import numpy as np
+
+import bidirectionalrrt, extra_credit, prm, rrtstar, unidirectionalrrt
+from plotters  import NullPlotter
+from stats     import Stats
+from utilities import PlannerResult
+
+# Planner of every mode and whether it takes a step size
+PLANNERS = {'unidirectional': (unidirectionalrrt.plan, True),
+            'bidirectional' : (bidirectionalrrt.plan,  True),
+            'rrtstar'       : (rrtstar.plan,           True),
+            'lazy'          : (functools.partial(unidirectionalrrt.plan, lazy=True), True),
+            'extra'         : (extra_credit.plan,      False),
+            'prm'           : (prm.plan,               False)}
+
+class Cancelled(Exception):
+    """ Raised inside a worker once another member of the portfolio has finished """
+
+class CancelObserver(NullPlotter):
+    """ Observer that aborts the planner it is attached to once 'stop' is set. Planners
+    report every node they add, so cancellation takes effect within one expansion """
+    def __init__(self, stop):
+        self.stop = stop
+
+    def _check(self):
+        if self.stop.is_set(): raise Cancelled()
+        return self._artist
+
+    draw_circle    = lambda self, *args, **kwargs: self._check()
+    draw_line      = lambda self, *args, **kwargs: self._check()
+    draw_rectangle = lambda self, *args, **kwargs: self._check()
+
+# World and stop event of a worker process, set once by the pool initializer
+_world, _stop = None, None
+
+def _init(world, stop):
+    global _world, _stop
+    _world, _stop = world, stop
+
+def _solve(job):
+    """ Runs one seeded planner in a worker. The search tree stays in the worker, only
+    the path, node count, timings and counters (if with_stats, also of a cancelled run)
+    are sent back """
+    mode, seed, start, goal, step_size, max_size, with_stats = job
+    planner, stepped = PLANNERS[mode]
+    args  = (step_size, max_size) if stepped else (max_size,)
+    stats = Stats() if with_stats else None
+    try:
+        result = planner(_world, start, goal, *args, observer=CancelObserver(_stop),
+                         rng=np.random.RandomState(seed), stats=stats)
+    except Cancelled:
+        result = None
+    counters = stats.as_dict() if stats is not None else None
+    if result is None: return seed, None, counters
+    return seed, PlannerResult(result.path, None, result.n, result.timings), counters
+
+def plan(obstacles, start, goal, step_size, max_size, mode='unidirectional', seeds=4,
+         workers=None, budget=None, stats=None):
+    """ Runs 'seeds' independently seeded planners of the given mode on a process pool.
+    Without a budget the first solution found is returned and the other runs cancelled.
+    With a budget (in seconds) the shortest path found within it is returned. The world
+    is sent to every worker once, when the pool starts. The counters and timers of the
+    runs that reported back are added to 'stats' """
+    t_start = time.perf_counter()
+    seeds   = list(range(seeds)) if isinstance(seeds, int) else list(seeds)
+    stop    = mp.Event()
+    jobs    = [(mode, seed, tuple(start), tuple(goal), step_size, max_size, stats is not None)
+               for seed in seeds]
+    best, best_seed, n, finished = None, None, 0, 0
+
+    pool = mp.Pool(workers or min(len(seeds), mp.cpu_count()), _init, (obstacles, stop))
+    try:
+        results = pool.imap_unordered(_solve, jobs)
+        while finished < len(jobs):
+            timeout = None if budget is None else max(budget - (time.perf_counter() - t_start), 0)
+            try:
+                seed, result, counters = results.next(timeout)
+            except mp.TimeoutError:
+                break
+            finished += 1
+            if counters is not None: stats.merge(counters)
+            if result is None: continue
+            n += result.n
+            if best is None or result.length < best.length: best, best_seed = result, seed
+            if budget is None and best.success: break
+        stop.set()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    t_end   = time.perf_counter()
+    timings = {'total': t_end-t_start}
+    if best is not None: timings['winner'] = best.timings['total']
+    result  = PlannerResult(best.path if best is not None else None, None, n, timings)
+    result.seed, result.runs = best_seed, finished
+    return result
+
+def run(obstacles, start, goal, step_size, max_size, mode='unidirectional', seeds=4,
+        budget=None, plotter=None, stats=None):
+    result = plan(obstacles, start, goal, step_size, max_size, mode, seeds, budget=budget, stats=stats)
+    print("n =", result.n, "runs =", result.runs, "seed =", result.seed)
+
+    if result.success and plotter is not None:
+        unidirectionalrrt.draw_path(result.path, plotter, min(step_size/5, 5))
+    return result
@@ -0,0 +1,197 @@
+from __future__ import division
+
+import os
+import math
+import time
+import hashlib
+from heapq import heappush, heappop
+import numpy as np
+
+from KDTree    import KDTree
+from obstacles import Obstacles
+from plotters  import NullPlotter
+from samplers  import UniformSampler
+from stats     import NULL_STATS, TimedObserver, restores_stats
+from utilities import PlannerResult
+from unidirectionalrrt import draw_path
+
+VERSION = 2 # Of the cached roadmaps, bumped when the construction changes
+
+class Roadmap:
+    """ Probabilistic roadmap over Q_free: 'size' uniform samples, each connected to its
+    k nearest neighbours by the free straight edges among them. The graph is stored in
+    compressed row storage (neighbours[indptr[i]:indptr[i+1]] are the neighbours of node i,
+    with the matching edge lengths in 'weights') and the nodes in a KDTree """
+    def __init__(self, obstacles, size=2000, k=10, rng=None, stats=NULL_STATS):
+        rng = rng if rng is not None else np.random
+        sampler = UniformSampler(obstacles, rng=rng)
+        with stats.timer('sample'):
+            nodes = np.array([sampler.sample() for _ in range(size)])
+
+        # Candidate edges to the k nearest neighbours of either end, each unordered pair checked once
+        KD = KDTree.from_points(nodes)
+        with stats.timer('neighbours'):
+            pairs = [(min(i, j), max(i, j)) for i in range(size) for j in KD.neighbours(nodes[i], k+1)[0]
+                     if i != j]
+        pairs = np.array(pairs, int).reshape(-1, 2)
+        pairs = pairs[np.unique(pairs[:,0]*size + pairs[:,1], return_index=True)[1]]
+        with stats.timer('collision'):
+            free = ~obstacles.check_collisions_batch(nodes[pairs])
+        self._setup(nodes, pairs[free], KD)
+        self.k = k
+        stats.count('samples_drawn', sampler.drawn)
+        stats.count('samples_rejected', sampler.rejected)
+
+    def _setup(self, nodes, edges, KD=None):
+        """ Adjacency of the undirected (M, 2) node index pairs """
+        src   = np.concatenate([edges[:,0], edges[:,1]])
+        dst   = np.concatenate([edges[:,1], edges[:,0]])
+        order = np.argsort(src, kind='stable')
+        self.nodes      = nodes
+        self.edges      = edges
+        self.neighbours = dst[order]
+        self.weights    = np.hypot(*(nodes[src] - nodes[dst]).T)[order]
+        self.indptr     = np.searchsorted(src[order], np.arange(len(nodes)+1))
+        self.KD         = KD if KD is not None else KDTree.from_points(nodes)
+
+        # Plain python copies for the graph search, indexing numpy arrays is slow
+        self._nodes      = nodes.tolist()
+        self._neighbours = self.neighbours.tolist()
+        self._weights    = self.weights.tolist()
+        self._indptr     = self.indptr.tolist()
+
+    size = property(lambda self: len(self.nodes))
+
+    def connect(self, obstacles, q, k=None):
+        """ Indices of and distances to the k nearest nodes seen from q with a free edge """
+        idx, dist = self.KD.neighbours(q, k or self.k)
+        if not idx: return [], []
+        free = ~obstacles.check_collisions_batch([(q[:2], self._nodes[i]) for i in idx])
+        return [i for i, f in zip(idx, free) if f], [d for d, f in zip(dist, free) if f]
+
+    def search(self, sources, targets, goal):
+        """ A* from the 'sources' to the 'targets' (dicts of node index -> length of the
+        edge from the start or to the goal) with the straight line heuristic to the goal.
+        Returns the node indices of the shortest path, None if there is none """
+        nodes, nbrs, wts, ptr = self._nodes, self._neighbours, self._weights, self._indptr
+        gx, gy = goal[:2]
+        h      = lambda i: math.hypot(nodes[i][0]-gx, nodes[i][1]-gy)
+
+        cost, parent, heap = {}, {}, []
+        for i, c in sources.items():
+            cost[i], parent[i] = c, -1
+            heappush(heap, (c + h(i), c, i))
+
+        best, best_end, done = float('inf'), None, set()
+        while heap:
+            f, c, i = heappop(heap)
+            if f >= best: break
+            if i in done: continue
+            done.add(i)
+            if i in targets and c + targets[i] < best: best, best_end = c + targets[i], i
+
+            for e in range(ptr[i], ptr[i+1]):
+                j, cj = nbrs[e], c + wts[e]
+                if cj < cost.get(j, float('inf')):
+                    cost[j], parent[j] = cj, i
+                    heappush(heap, (cj + h(j), cj, j))
+
+        if best_end is None: return None
+        path, i = [], best_end
+        while i != -1:
+            path.append(i)
+            i = parent[i]
+        return path[::-1]
+
+    def query(self, obstacles, start, goal):
+        """ Shortest roadmap path from start to goal as a list of (x, y), None if the roadmap
+        does not connect them """
+        start, goal = tuple(start[:2]), tuple(goal[:2])
+        if not obstacles.check_collisions((start, goal)): return [start, goal]
+
+        sources, targets = (dict(zip(*self.connect(obstacles, q))) for q in (start, goal))
+        if not sources or not targets: return None
+        path = self.search(sources, targets, goal)
+        if path is None: return None
+        return [start] + [tuple(self._nodes[i]) for i in path] + [goal]
+
+    def save(self, path, key=''):
+        np.savez_compressed(path, nodes=self.nodes, edges=self.edges, k=self.k, key=key)
+
+    @classmethod
+    def load(cls, path, key=None):
+        """ Roadmap saved at 'path', None if missing or saved under another key """
+        if not os.path.exists(path): return None
+        with np.load(path) as data:
+            if key is not None and str(data['key']) != key: return None
+            self = cls.__new__(cls)
+            self._setup(data['nodes'], data['edges'])
+            self.k = int(data['k'])
+        return self
+
+def cached(obstacles, obstacle_path, size=2000, k=10, seed=0):
+    """ Roadmap of the world read from obstacle_path, built once and cached next to it.
+    The cache is rebuilt when the world file or any parameter changes """
+    with open(obstacle_path, 'rb') as f: digest = hashlib.sha1(f.read()).hexdigest()
+    key   = "%s %d %d %d %d"%(digest, size, k, seed, VERSION)
+    cache = "%s.prm.npz"%obstacle_path
+    roadmap = Roadmap.load(cache, key)
+    if roadmap is None:
+        roadmap = Roadmap(obstacles, size, k, np.random.RandomState(seed))
+        try:
+            roadmap.save(cache, key)
+        except OSError:
+            pass # Read-only location, the roadmap is still used for this run
+    return roadmap
+
+@restores_stats
+def plan(obstacles, start, goal, max_size, observer=None, rng=None, stats=None, roadmap=None):
+    """ Answers the query with the given roadmap, or one of max_size nodes built for it.
+    Nothing is reported to 'observer', run draws the roadmap and the path """
+    observer  = observer if observer is not None else NullPlotter()
+    stats     = stats if stats is not None else NULL_STATS
+    if stats.enabled: observer = TimedObserver(observer, stats)
+    t_start   = time.perf_counter()
+    if not isinstance(obstacles, Obstacles): obstacles = Obstacles(obstacles.to_polygons())
+    obstacles.stats = stats
+
+    if roadmap is None: roadmap = Roadmap(obstacles, max_size, rng=rng, stats=stats)
+    t_search  = time.perf_counter()
+    with stats.timer('query'):
+        path  = roadmap.query(obstacles, start, goal)
+
+    t_end   = time.perf_counter()
+    timings = {'setup': t_search-t_start, 'search': t_end-t_search, 'total': t_end-t_start}
+    return PlannerResult(path, roadmap, roadmap.size, timings)
+
+def draw_roadmap(roadmap, plotter, circ_rad=2):
+    """ Draws the roadmap edges and nodes """
+    for i, j in roadmap.edges:
+        plotter.draw_line(roadmap._nodes[i], roadmap._nodes[j], update=False, color='0.7', zorder=1)
+    for q in roadmap._nodes:
+        plotter.draw_circle(q, circ_rad, update=False, edgecolor='k', facecolor='w', zorder=2)
+    plotter.update()
+
+def run(obstacles, start, goal, max_size, plotter=None, stats=None, roadmap=None):
+    result = plan(obstacles, start, goal, max_size, stats=stats, roadmap=roadmap)
+    print("n =", result.n)
+
+    if plotter is not None:
+        draw_roadmap(result.tree, plotter)
+        if result.success: draw_path(result.path, plotter, 5)
+    return result
+
+if __name__ == '__main__':
+    from ImageGenerator import ImageGenerator
+    from utilities      import get_obstacle_course, get_start_and_goal
+
+    obstacles   = get_obstacle_course("world_obstacles.txt")
+    start, goal = get_start_and_goal("start_goal.txt")
+
+    plotter    = ImageGenerator()
+    plotter.draw_obstacle_course(obstacles)
+    plotter.draw_start_and_goal(start,goal)
+
+    run(obstacles, start, goal, 2000, plotter)
+
+    input("Press enter to exit : ")
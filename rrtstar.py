@@ -0,0 +1,129 @@
+from __future__ import division
+
+import math
+import time
+import numpy as np
+
+from KDTree    import KDTree
+from obstacles import Obstacles
+from plotters  import NullPlotter
+from samplers  import GOAL_BIAS, UniformSampler, take_goal
+from stats     import NULL_STATS, TimedObserver, restores_stats
+from utilities import gen_next, PathTree, PlannerResult
+from unidirectionalrrt import draw_path
+
+def rewire_radius(sampler, n, step_size):
+    """ Shrinking RRT* neighbourhood radius min(gamma * sqrt(log(n)/n), step_size), with
+    gamma above the 2D bound 2*sqrt(1 + 1/2)*sqrt(area(Q_free)/pi) from the RRT* paper.
+    The free area is taken from the sampler """
+    gamma = 1.1 * 2 * math.sqrt(1.5) * math.sqrt(sampler.free_area / math.pi)
+    return min(gamma * math.sqrt(math.log(n+1) / (n+1)), step_size)
+
+@restores_stats
+def plan(obstacles, start, goal, step_size, max_size, observer=None, rng=None, stats=None, sampler=None,
+         goal_bias=GOAL_BIAS):
+    """ Grows an RRT* of max_size nodes from start, choosing the cheapest parent for every
+    new node and rewiring its neighbours through it. Reports progress to 'observer' and
+    the time spent in each phase to 'stats'. Samples are drawn like in unidirectionalrrt """
+    observer  = observer if observer is not None else NullPlotter()
+    rng       = rng if rng is not None else np.random
+    stats     = stats if stats is not None else NULL_STATS
+    timed     = stats.enabled # The phases of the search loop are only timed if set
+    if timed: observer = TimedObserver(observer, stats)
+    t_start   = time.perf_counter()
+    circ_rad  = min(step_size/5, 5)
+    final_pos = np.array(goal[:2])
+    goal      = tuple(goal[:2])
+
+    KD    = KDTree(start)
+    RRT   = PathTree(start)
+    lines = {} # Drawn edge of every node, replaced when it is rewired
+    if not isinstance(obstacles, Obstacles): obstacles = Obstacles(obstacles.to_polygons())
+    sampler   = (sampler or UniformSampler)(obstacles, rng=rng)
+    t_search  = time.perf_counter()
+    t_found   = None
+    obstacles.stats = stats
+
+    while KD.length < max_size:
+        # Select a random point q_rand \in Q_free and steer towards it
+        if timed: t0 = time.perf_counter()
+        q_rand = final_pos if take_goal(rng, goal_bias) else sampler.sample()
+        if timed: stats.add('sample', t0)
+        if timed: t0 = time.perf_counter()
+        q_near, dist = KD.nearestNode(q_rand)
+        if timed: stats.add('nearest', t0)
+        if dist == 0: continue
+        q_new = tuple(q_rand) if dist <= step_size else gen_next(q_near, q_rand, step_size)
+        if q_new in RRT: continue
+        if timed: t0 = time.perf_counter()
+        valid = obstacles.point_is_valid(*q_new)
+        if timed: stats.add('point_check', t0)
+        if not valid: continue
+
+        # Neighbourhood of q_new, all connecting edges are checked in one batch
+        radius = rewire_radius(sampler, KD.length+1, step_size)
+        if timed: t0 = time.perf_counter()
+        near = [p for p, _ in KD.within_radius(q_new, radius)]
+        if timed: stats.add('neighbours', t0)
+        if q_near not in near: near.append(q_near)
+        dists  = [math.hypot(q_new[0]-p[0], q_new[1]-p[1]) for p in near]
+        if timed: t0 = time.perf_counter()
+        free = ~obstacles.check_collisions_batch([(p[:2], q_new) for p in near])
+        if timed: stats.add('collision', t0)
+        if not free.any(): continue
+
+        # Connect q_new through the neighbour with the cheapest path from start
+        costs  = [RRT[p].cost + d if ok else float('inf') for p, d, ok in zip(near, dists, free)]
+        parent = near[int(np.argmin(costs))]
+        if timed: t0 = time.perf_counter()
+        KD.addNode(q_new)
+        RRT.addPath(parent, q_new)
+        if timed: stats.add('insert', t0)
+        lines[q_new] = observer.draw_line(parent, q_new, color='k', zorder=1, update=False)
+        observer.draw_circle(q_new, circ_rad, edgecolor='k', facecolor='w', zorder=2)
+
+        # Rewire neighbours whose path is shorter through q_new
+        cost = RRT[q_new].cost
+        for p, d, ok in zip(near, dists, free):
+            if ok and p != parent and cost + d < RRT[p].cost - 1e-9:
+                if timed: t0 = time.perf_counter()
+                RRT.changeParent(p, q_new)
+                if timed: stats.add('rewire', t0)
+                lines[p].remove()
+                lines[p] = observer.draw_line(q_new, p, color='k', zorder=1, update=False)
+
+        if t_found is None and goal in RRT: t_found = time.perf_counter()
+
+    t_end   = time.perf_counter()
+    stats.count('samples_drawn', sampler.drawn)
+    stats.count('samples_rejected', sampler.rejected)
+    stats.count('kd_rebuilds', KD.rebuilds)
+    timings = {'setup': t_search-t_start, 'search': t_end-t_search, 'total': t_end-t_start}
+    if t_found is not None: timings['first_solution'] = t_found-t_search
+    path    = RRT.pathTo(goal) if goal in RRT else None
+    return PlannerResult(path, RRT, KD.length, timings)
+
+def run(obstacles, start, goal, step_size, max_size, plotter=None, stats=None, sampler=None,
+        goal_bias=GOAL_BIAS):
+    result = plan(obstacles, start, goal, step_size, max_size, plotter, stats=stats, sampler=sampler,
+                  goal_bias=goal_bias)
+    print("n =", result.n, "cost = %.2f"%result.length)
+
+    if result.success and plotter is not None:
+        draw_path(result.path, plotter, min(step_size/5, 5))
+    return result
+
+if __name__ == '__main__':
+    from ImageGenerator import ImageGenerator
+    from utilities      import get_obstacle_course, get_start_and_goal
+
+    obstacles   = get_obstacle_course("world_obstacles.txt")
+    start, goal = get_start_and_goal("start_goal.txt")
+
+    plotter    = ImageGenerator()
+    plotter.draw_obstacle_course(obstacles)
+    plotter.draw_start_and_goal(start,goal)
+
+    run(obstacles, start, goal, 50, 2000, plotter)
+
+    input("Press enter to exit : ")
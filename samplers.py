@@ -0,0 +1,182 @@
+from __future__ import division
+import functools
+from bisect import bisect_right
+import numpy as np
+
+# Share of the draws where planners sample their goal, 6 in 100 as originally
+GOAL_BIAS = 0.06
+
+def sampling_box(obstacles):
+    """ Corners of the obstacle bounding box padded by 5% on every side """
+    minp, maxp = obstacles.bounds
+    return minp-(maxp-minp)*0.05, maxp+(maxp-minp)*0.05
+
+class UniformSampler:
+    """ Draws uniform samples in Q_free by rejection from the padded obstacle bounding box.
+    Candidates are drawn and filtered in blocks, valid samples are handed out from a buffer.
+    Worlds with a free space decomposition (obstacles.free_space, see freespace.py) are
+    sampled from it instead, without any rejection. Samples are positions, the planner
+    draws their heading if it needs one, so 'footprint' (see GaussianSampler) is unused """
+    def __init__(self, obstacles, block_size=256, rng=np.random, footprint=None):
+        lo, hi       = sampling_box(obstacles)
+        self.span    = hi-lo
+        self.offset  = lo
+        self.obstacles  = obstacles
+        self.block_size = block_size
+        self.rng     = rng
+        self.buffer  = np.zeros((0, 2))
+        self.index   = 0
+        self.drawn, self.rejected = 0, 0
+
+    @property
+    def free_area(self):
+        """ Area of Q_free within the box, estimated from the acceptance rate so far unless
+        the free space is decomposed """
+        if self.obstacles.free_space is not None: return self.obstacles.free_space.area
+        return np.prod(self.span) * (1 - self.rejected / max(self.drawn, 1))
+
+    def _refill(self):
+        if self.obstacles.free_space is not None:
+            self.buffer = self.obstacles.free_space.sample(self.block_size, self.rng)
+            self.index  = 0
+            self.drawn += self.block_size
+            return
+        candidates  = self.rng.random_sample((self.block_size, 2)) * self.span + self.offset
+        self.buffer = candidates[self.obstacles.point_is_valid_batch(candidates)]
+        self.index  = 0
+        self.drawn    += self.block_size
+        self.rejected += self.block_size - len(self.buffer)
+
+    def sample(self):
+        """ Returns a valid q_rand in Q_free """
+        while self.index >= len(self.buffer): self._refill()
+        self.index += 1
+        return self.buffer[self.index-1]
+
+class GaussianSampler(UniformSampler):
+    """ Gaussian sampling, biased towards obstacle boundaries: every uniform candidate gets
+    a partner at a normally distributed offset of spread 'sigma', and the free one of the
+    pair is kept if the other one collides.
+
+    With a 'footprint' mask of which (N, 3) poses are free, candidates get a uniform heading
+    shared by their partner, the test is made for the robot within that C-space slice and
+    the samples are (x, y, heading) poses. If 'max_refills' refills in a row give nothing,
+    the sample is drawn uniformly instead """
+    max_refills = 32
+
+    def __init__(self, obstacles, sigma=20., block_size=256, rng=np.random, footprint=None):
+        UniformSampler.__init__(self, obstacles, block_size, rng)
+        self.sigma     = sigma
+        self.footprint = footprint
+        self.box_drawn, self.box_free, self.fallbacks = 0, 0, 0
+        self._uniform  = None
+
+    @property
+    def free_area(self):
+        if self.obstacles.free_space is not None: return self.obstacles.free_space.area
+        return np.prod(self.span) * self.box_free / max(self.box_drawn, 1)
+
+    def _valid(self, q):
+        if self.footprint is None: return self.obstacles.point_is_valid_batch(q)
+        return self.footprint(q)
+
+    def _pairs(self):
+        """ Uniform candidates, which of them are free, and their partners inside the box
+        (pairs with a partner outside are never used) """
+        n  = self.block_size
+        q1 = self.rng.random_sample((n, 2)) * self.span + self.offset
+        q2 = q1 + self.rng.normal(0, self.sigma, (n, 2))
+        inside = ((q2 >= self.offset) & (q2 <= self.offset + self.span)).all(1)
+        if self.footprint is not None:
+            alpha  = self.rng.random_sample((n, 1)) * 2*np.pi
+            q1, q2 = np.c_[q1, alpha], np.c_[q2, alpha]
+        free   = self._valid(q1)
+        self.drawn     += n
+        self.box_drawn += n
+        self.box_free  += int(free.sum())
+        return q1[inside], q2[inside], free[inside]
+
+    def _fill(self, samples):
+        self.buffer    = samples
+        self.index     = 0
+        self.rejected += self.block_size - len(samples)
+
+    def _refill(self):
+        q1, q2, free1 = self._pairs()
+        free2 = self._valid(q2)
+        keep  = free1 != free2
+        self._fill(np.where(free1[keep,None], q1[keep], q2[keep]))
+
+    def sample(self):
+        refills = 0
+        while self.index >= len(self.buffer):
+            if refills == self.max_refills: return self._fallback()
+            self._refill()
+            refills += 1
+        self.index += 1
+        return self.buffer[self.index-1]
+
+    def _fallback(self):
+        """ Uniform sample, counted in the draws and rejections of this sampler """
+        if self._uniform is None: self._uniform = UniformSampler(self.obstacles, self.block_size, self.rng)
+        u = self._uniform
+        drawn, rejected = u.drawn, u.rejected
+        q = u.sample()
+        self.drawn     += u.drawn - drawn
+        self.rejected  += u.rejected - rejected
+        self.fallbacks += 1
+        return q
+
+class BridgeSampler(GaussianSampler):
+    """ Bridge test sampling, biased towards narrow passages: of the pairs drawn like for
+    GaussianSampler, those with both ends in collision give their midpoint if it is free.
+    Partners are only checked for the candidates in collision """
+    def _refill(self):
+        q1, q2, free1 = self._pairs()
+        q1, q2 = q1[~free1], q2[~free1]
+        both   = ~self._valid(q2)
+        middle = (q1[both] + q2[both]) / 2
+        self._fill(middle[self._valid(middle)])
+
+class MixtureSampler:
+    """ Draws from one of several samplers each time, picked at random with probability
+    proportional to its weight. 'components' lists (weight, factory) pairs, every factory
+    building its sampler from (obstacles, rng=rng, footprint=footprint) """
+    def __init__(self, obstacles, components, rng=np.random, footprint=None):
+        weights       = np.array([w for w, _ in components], float)
+        self.samplers = [factory(obstacles, rng=rng, footprint=footprint) for _, factory in components]
+        self.cumulative = (np.cumsum(weights) / weights.sum()).tolist()
+        self.rng      = rng
+
+    drawn    = property(lambda self: sum(s.drawn for s in self.samplers))
+    rejected = property(lambda self: sum(s.rejected for s in self.samplers))
+
+    @property
+    def free_area(self):
+        """ Free area estimated by the components, weighted by their draws """
+        drawn = [s.drawn for s in self.samplers]
+        if not sum(drawn): return self.samplers[0].free_area
+        return sum(s.free_area * d for s, d in zip(self.samplers, drawn)) / sum(drawn)
+
+    def sample(self):
+        i = bisect_right(self.cumulative, self.rng.random_sample())
+        return self.samplers[min(i, len(self.samplers)-1)].sample()
+
+SAMPLERS = {'uniform': UniformSampler, 'gaussian': GaussianSampler, 'bridge': BridgeSampler}
+
+def from_spec(spec, sigma=20.):
+    """ Sampler factory of 'uniform', 'gaussian', 'bridge' or a mixture with weights such
+    as 'uniform:0.7,bridge:0.3'. Gaussian and bridge samplers use the spread 'sigma' """
+    components = []
+    for item in spec.split(','):
+        name, _, weight = item.strip().partition(':')
+        if name not in SAMPLERS: raise ValueError("unknown sampler %r"%name)
+        factory = SAMPLERS[name] if name == 'uniform' else functools.partial(SAMPLERS[name], sigma=sigma)
+        components.append((float(weight or 1), factory))
+    if len(components) == 1: return components[0][1]
+    return functools.partial(MixtureSampler, components=components)
+
+def take_goal(rng, goal_bias=GOAL_BIAS):
+    """ Whether a planner samples its goal instead of Q_free on this draw. The choice is a
+    random integer percent, so the default is the original randint(0, 100) > 5 test """
+    return rng.randint(0, 100) < round(100 * goal_bias)
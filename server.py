@@ -0,0 +1,248 @@
+from __future__ import division
+
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+import multiprocessing as mp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+import prm, worldcache
+from obstacles import Obstacles
+from portfolio import PLANNERS, Cancelled, CancelObserver
+from stats     import Stats
+from utilities import get_obstacle_course
+
+def _cancel(signum, frame):
+    raise Cancelled()
+
+class Deadline:
+    """ Stop flag that is set once time.time() passes 'deadline', for the CancelObserver.
+
+    Planners only report to their observer when they add a node, and a start or goal in a
+    tiny pocket can keep them rejecting samples forever. Where available, the block of a
+    'with deadline:' statement is therefore also interrupted by a timer signal """
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self._handler = None
+
+    is_set = lambda self: time.time() > self.deadline
+
+    def __enter__(self):
+        if hasattr(signal, 'setitimer') and self.deadline != float('inf') and \
+           threading.current_thread() is threading.main_thread():
+            self._handler = signal.signal(signal.SIGALRM, _cancel)
+            signal.setitimer(signal.ITIMER_REAL, max(self.deadline - time.time(), 1e-3))
+        return self
+
+    def __exit__(self, *exc):
+        if self._handler is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._handler)
+            self._handler = None
+
+# Worlds and roadmaps of a worker process, set once by the pool initializer
+_worlds, _roadmaps = None, None
+
+def init_worker(worlds, roadmaps):
+    global _worlds, _roadmaps
+    _worlds, _roadmaps = worlds, roadmaps
+
+def solve(job):
+    """ Runs one planner job (a server request or batch query) in a worker process set up
+    by init_worker. Returns the JSON-ready reply, None if it ran past its deadline """
+    world, mode, start, goal, step_size, max_size, seed, deadline, with_stats = job
+    planner, stepped = PLANNERS[mode]
+    args   = (step_size, max_size) if stepped else (max_size,)
+    kwargs = {'roadmap': _roadmaps[world]} if mode == 'prm' and world in _roadmaps else {}
+    stats  = Stats() if with_stats else None
+    try:
+        with Deadline(deadline) as stop:
+            result = planner(_worlds[world], start, goal, *args, observer=CancelObserver(stop),
+                             rng=np.random.RandomState(seed), stats=stats, **kwargs)
+    except Cancelled:
+        return None
+    reply = {'success': result.success, 'path': [list(map(float, q)) for q in result.path] if result.success else None,
+             'length': result.length if result.success else None, 'n': result.n, 'seed': seed,
+             'timings': result.timings}
+    if stats is not None: reply['stats'] = stats.as_dict()
+    return reply
+
+class PlanningServer(ThreadingHTTPServer):
+    """ HTTP planning service over preloaded worlds. Requests run on a process pool; at most
+    'max_concurrent' are accepted at once, the others are turned away with 503 """
+    daemon_threads = True
+
+    def __init__(self, address, worlds, roadmaps=None, workers=None, max_concurrent=None, timeout=30.,
+                 verbose=False):
+        ThreadingHTTPServer.__init__(self, address, Handler)
+        workers        = workers or mp.cpu_count()
+        self.worlds    = worlds
+        self.roadmaps  = roadmaps or {}
+        self.timeout   = timeout
+        self.verbose   = verbose
+        self.pool      = mp.Pool(workers, init_worker, (worlds, self.roadmaps))
+        self.slots     = threading.BoundedSemaphore(max_concurrent or 2*workers)
+        self.lock      = threading.Lock()
+        self.started   = time.time()
+        self.in_flight = 0
+        self.counters  = dict.fromkeys(['requests', 'solved', 'unsolved', 'timeouts', 'rejected',
+                                        'bad_requests', 'errors'], 0)
+        self.latency   = [0., 0.] # Total and max seconds of the completed requests
+        self.modes     = {}
+
+    def _count(self, name, seconds=None):
+        with self.lock:
+            self.counters[name] += 1
+            if seconds is not None:
+                self.latency[0] += seconds
+                self.latency[1]  = max(self.latency[1], seconds)
+
+    def _job(self, request):
+        """ Validated planner job of a request, raises ValueError with the reason """
+        if not isinstance(request, dict): raise ValueError("request must be a JSON object")
+        world = request.get('world', next(iter(self.worlds)))
+        mode  = request.get('mode', 'unidirectional')
+        if world not in self.worlds: raise ValueError("unknown world %r"%world)
+        if mode not in PLANNERS:     raise ValueError("unknown mode %r"%mode)
+        size  = 3 if mode == 'extra' else 2
+        poses = []
+        for key in ('start', 'goal'):
+            pose = request.get(key)
+            if not isinstance(pose, list) or len(pose) != size or \
+               not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in pose):
+                raise ValueError("%s must be a list of %d numbers for the %s mode"%(key, size, mode))
+            poses.append(tuple(map(float, pose)))
+        step_size = float(request.get('step_size', 50))
+        max_size  = int(request.get('max_size', 2000))
+        seed      = int(request.get('seed', 0))
+        timeout   = min(float(request.get('timeout', self.timeout)), self.timeout)
+        if step_size <= 0 or max_size <= 0 or timeout <= 0:
+            raise ValueError("step_size, max_size and timeout must be positive")
+        return (world, mode) + tuple(poses) + (step_size, max_size, seed, time.time() + timeout,
+                                                bool(request.get('stats', False))), timeout
+
+    def plan(self, request):
+        """ HTTP status and JSON reply of a planning request """
+        t_start = time.perf_counter()
+        self._count('requests')
+        try:
+            job, timeout = self._job(request)
+        except (ValueError, TypeError) as e:
+            self._count('bad_requests')
+            return 400, {'error': str(e)}
+
+        if not self.slots.acquire(blocking=False):
+            self._count('rejected')
+            return 503, {'error': 'busy'}
+        with self.lock:
+            self.in_flight += 1
+            self.modes[job[1]] = self.modes.get(job[1], 0) + 1
+        try:
+            # The worker gives up at the deadline, the extra second covers a busy pool
+            reply = self.pool.apply_async(solve, (job,)).get(timeout + 1)
+        except mp.TimeoutError:
+            reply = None
+        except Exception as e:
+            self._count('errors')
+            return 500, {'error': repr(e)}
+        finally:
+            with self.lock: self.in_flight -= 1
+            self.slots.release()
+
+        elapsed = time.perf_counter() - t_start
+        if reply is None:
+            self._count('timeouts', elapsed)
+            return 504, {'error': 'timeout', 'timeout': timeout}
+        self._count('solved' if reply['success'] else 'unsolved', elapsed)
+        reply['timings']['request'] = elapsed
+        return 200, reply
+
+    def health(self):
+        return {'status': 'ok', 'worlds': sorted(self.worlds), 'modes': sorted(PLANNERS),
+                'roadmaps': sorted(self.roadmaps), 'uptime': time.time() - self.started}
+
+    def metrics(self):
+        with self.lock:
+            done = sum(self.counters[k] for k in ('solved', 'unsolved', 'timeouts'))
+            return dict(self.counters, in_flight=self.in_flight, modes=dict(self.modes),
+                        latency_mean=self.latency[0] / max(done, 1), latency_max=self.latency[1],
+                        uptime=time.time() - self.started)
+
+    def server_close(self):
+        ThreadingHTTPServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+
+class Handler(BaseHTTPRequestHandler):
+    """ GET /health, GET /metrics and POST /plan with a JSON body such as
+    {"world": "world_obstacles.txt", "mode": "bidirectional", "start": [x, y], "goal": [x, y],
+     "step_size": 50, "max_size": 2000, "seed": 0, "timeout": 5, "stats": false} """
+    def do_GET(self):
+        if   self.path == '/health':  self._reply(200, self.server.health())
+        elif self.path == '/metrics': self._reply(200, self.server.metrics())
+        else:                         self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/plan': return self._reply(404, {'error': 'not found'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            return self._reply(400, {'error': 'invalid JSON'})
+        self._reply(*self.server.plan(request))
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose: BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def load_worlds(paths, world_cache=False, prm_nodes=0):
+    """ Worlds (and roadmaps, if prm_nodes) keyed by the base name of their obstacle files """
+    worlds, roadmaps = {}, {}
+    for path in paths:
+        name = os.path.basename(path)
+        worlds[name] = worldcache.load_world(path) if world_cache else \
+                           Obstacles(get_obstacle_course(path).to_polygons())
+        if prm_nodes: roadmaps[name] = prm.cached(worlds[name], path, prm_nodes)
+    return worlds, roadmaps
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Local planning service answering JSON requests over HTTP",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--worlds", nargs="+", default=["world_obstacles.txt"],
+                            help="Obstacle filepaths to preload, requested by base name")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", default=8000, type=int, help="Port to listen on")
+    parser.add_argument("--workers", default=None, type=int, help="Planner processes (CPU count if unset)")
+    parser.add_argument("--max-concurrent", default=None, type=int,
+                            help="Requests accepted at once, others get 503 (twice the workers if unset)")
+    parser.add_argument("--timeout", default=30., type=float,
+                            help="Max seconds per request, requests may ask for less")
+    parser.add_argument("--prm-nodes", default=2000, type=int,
+                            help="Nodes of the cached roadmap of every world used by the prm mode (0 disables)")
+    parser.add_argument("--world-cache", action="store_true",
+                            help="Load the worlds from their compiled binary copies")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    args = parser.parse_args()
+
+    worlds, roadmaps = load_worlds(args.worlds, args.world_cache, args.prm_nodes)
+    server = PlanningServer((args.host, args.port), worlds, roadmaps, args.workers, args.max_concurrent,
+                            args.timeout, args.verbose)
+    print("Serving %s on http://%s:%d"%(', '.join(sorted(worlds)), args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
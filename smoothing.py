@@ -0,0 +1,87 @@
+from __future__ import division
+
+import time
+import numpy as np
+
+from stats     import NULL_STATS
+from utilities import path_length
+
+def _dedupe(points):
+    """ Drops consecutive duplicates of the (N, 2) points """
+    keep = np.r_[True, (np.diff(points, axis=0) != 0).any(1)]
+    return points[keep]
+
+def greedy(obstacles, path):
+    """ Walks the path from the start, jumping each time to the farthest vertex in sight.
+    All the segments from a vertex to the ones after it are checked in one batch """
+    points = _dedupe(np.asarray(path, float)[:,:2])
+    i, out = 0, [points[0]]
+    while i < len(points)-1:
+        ahead = np.arange(i+2, len(points))
+        if len(ahead):
+            free = ~obstacles.check_collisions_batch(np.stack([np.repeat(points[i:i+1], len(ahead), 0),
+                                                               points[ahead]], 1))
+            i = ahead[free].max() if free.any() else i+1
+        else:
+            i = i+1
+        out.append(points[i])
+    return np.array(out)
+
+def randomized(obstacles, points, budget, rng=np.random, batch_size=64, patience=8):
+    """ Shortcuts between random points anywhere along the path until 'budget' seconds have
+    passed or 'patience' batches in a row bring no improvement. Every batch draws
+    'batch_size' pairs of arc length positions, checks their segments in one call and
+    applies the free ones with the largest savings that do not overlap """
+    t_end, idle = time.perf_counter() + budget, 0
+    while time.perf_counter() < t_end and idle < patience and len(points) > 2:
+        cum = np.r_[0, np.cumsum(np.hypot(*np.diff(points, axis=0).T))]
+        t   = np.sort(rng.random_sample((batch_size, 2)) * cum[-1], 1)
+        seg = np.minimum(np.searchsorted(cum, t, 'right') - 1, len(points)-2)
+        lerp  = (t - cum[seg]) / np.maximum(cum[seg+1] - cum[seg], 1e-12)
+        ends  = points[seg] + lerp[...,None] * (points[seg+1] - points[seg])
+        gain  = (t[:,1] - t[:,0]) - np.hypot(*(ends[:,1] - ends[:,0]).T)
+        cand  = np.flatnonzero((seg[:,1] > seg[:,0]) & (gain > 1e-9))
+        if len(cand): cand = cand[~obstacles.check_collisions_batch(ends[cand])]
+        if not len(cand):
+            idle += 1
+            continue
+
+        # Largest savings first, skipping shortcuts overlapping an accepted one
+        cuts = []
+        for c in cand[np.argsort(-gain[cand])]:
+            if all(t[c,1] <= t[d,0] or t[c,0] >= t[d,1] for d in cuts): cuts.append(c)
+        out, i = [], 0
+        for c in sorted(cuts, key=lambda c: t[c,0]):
+            out += list(points[i:seg[c,0]+1]) + [ends[c,0], ends[c,1]]
+            i = seg[c,1] + 1
+        points, idle = _dedupe(np.array(out + list(points[i:]))), 0
+    return points
+
+def shortcut(obstacles, path, budget=0.05, rng=None):
+    """ Shorter collision-free version of the (x, y) path: a greedy pass over its vertices,
+    then randomized shortcuts for the rest of the time budget (in seconds). These add two
+    vertices per cut, a last greedy pass drops the ones no longer needed. Returns the path
+    as a list of (x, y) """
+    rng = rng if rng is not None else np.random
+    t_start = time.perf_counter()
+    points  = greedy(obstacles, path)
+    points  = randomized(obstacles, points, budget - (time.perf_counter() - t_start), rng)
+    points  = greedy(obstacles, points)
+    return [tuple(map(float, q)) for q in points]
+
+def run(obstacles, result, budget=0.05, plotter=None, rng=None, stats=NULL_STATS):
+    """ Shortcuts the path of a successful planner result, prints the lengths before and
+    after and highlights the new path. The result keeps the new path, which is also
+    returned, and the time spent in timings['shortcut'] """
+    from unidirectionalrrt import draw_path
+    t_start = time.perf_counter()
+    with stats.timer('shortcut'):
+        path = shortcut(obstacles, result.path, budget, rng)
+    result.timings['shortcut'] = time.perf_counter() - t_start
+    print("shortcut: length %.2f -> %.2f, %d -> %d vertices in %.3fs"%(result.length, path_length(path),
+          len(result.path), len(path), result.timings['shortcut']))
+    stats.count('shortcut_vertices_removed', len(result.path) - len(path))
+    result.path = path
+
+    if plotter is not None: draw_path(path, plotter, 5, color='r')
+    return path
@@ -0,0 +1,153 @@
+from __future__ import division
+import numpy as np
+
+def _expand(starts, counts):
+    """ Concatenation of the ranges [starts[i], starts[i]+counts[i]) and their owners i """
+    owner = np.repeat(np.arange(len(counts)), counts)
+    return owner, starts[owner] + np.arange(owner.size) - np.repeat(np.cumsum(counts)-counts, counts)
+
+def segment_cells(a, b, origin, resolution, shape, tol=1e-6):
+    """ Every grid cell touched by (or within 'tol' of) the segments (a[i], b[i]), where
+    cell (ix, iy) covers origin + [ix, ix+1) x [iy, iy+1) times the resolution.
+    Returns the segment index and the row-major flat index iy*nx + ix of each pair """
+    nx, ny = shape
+    a, b   = np.asarray(a, float).reshape(-1, 2), np.asarray(b, float).reshape(-1, 2)
+    swap   = a[:,0] > b[:,0]
+    p, q   = np.where(swap[:,None], b, a), np.where(swap[:,None], a, b)
+
+    # Columns spanned by each segment
+    c0 = np.maximum(np.floor((p[:,0] - tol - origin[0]) / resolution).astype(int), 0)
+    c1 = np.minimum(np.floor((q[:,0] + tol - origin[0]) / resolution).astype(int), nx-1)
+    seg, col = _expand(c0, np.maximum(c1-c0+1, 0))
+
+    # Part of the segment inside each column and the rows it spans
+    xl = np.maximum(origin[0] + col*resolution, p[seg,0])
+    xr = np.minimum(origin[0] + (col+1)*resolution, q[seg,0])
+    dx = q[seg,0] - p[seg,0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(dx > 0, (q[seg,1] - p[seg,1]) / dx, 0.)
+    ya = np.where(dx > 0, p[seg,1] + (xl - p[seg,0]) * slope, p[seg,1])
+    yb = np.where(dx > 0, p[seg,1] + (xr - p[seg,0]) * slope, q[seg,1])
+
+    r0 = np.maximum(np.floor((np.minimum(ya, yb) - tol - origin[1]) / resolution).astype(int), 0)
+    r1 = np.minimum(np.floor((np.maximum(ya, yb) + tol - origin[1]) / resolution).astype(int), ny-1)
+    pair, row = _expand(r0, np.maximum(r1-r0+1, 0))
+    return seg[pair], row*nx + col[pair]
+
+class EdgeGrid:
+    """ Uniform grid over the obstacle edges. Each cell lists the edges touching it
+    (compressed row storage) so queries only test the edges near them """
+    def __init__(self, edges, resolution=None, tol=1e-6):
+        points     = edges.reshape(-1, 2)
+        minp, maxp = points.min(0), points.max(0)
+        extent     = np.maximum(maxp - minp, 1e-9)
+
+        # Default cell size: about one cell per edge, but no smaller than the mean edge
+        if resolution is None:
+            lengths    = np.hypot(*(edges[:,1] - edges[:,0]).T)
+            resolution = max(np.sqrt(np.prod(extent) / len(edges)), lengths.mean())
+
+        self.resolution = float(resolution)
+        self.origin     = minp - self.resolution
+        self.shape      = tuple(int(n) for n in np.floor(extent/self.resolution) + 3)
+        self.tol        = tol
+
+        edge, cell = segment_cells(edges[:,0], edges[:,1], self.origin, self.resolution, self.shape, tol)
+        order      = np.lexsort((edge, cell))
+        self.cell_edges = edge[order]
+        self.cell_start = np.searchsorted(cell[order], np.arange(self.shape[0]*self.shape[1]+1))
+
+        self.queries, self.candidates = 0, 0
+
+        # Plain python copies for the scalar queries, indexing numpy scalars is slow
+        self._ox, self._oy = float(self.origin[0]), float(self.origin[1])
+        self._start = self.cell_start.tolist()
+
+    @classmethod
+    def from_arrays(cls, origin, resolution, shape, cell_edges, cell_start, tol=1e-6):
+        """ Grid from the arrays of one built earlier, as stored by worldcache.py """
+        self = cls.__new__(cls)
+        self.resolution, self.origin, self.shape, self.tol = float(resolution), np.asarray(origin, float), tuple(shape), tol
+        self.cell_edges, self.cell_start = cell_edges, cell_start
+        self.queries, self.candidates    = 0, 0
+        self._ox, self._oy = float(self.origin[0]), float(self.origin[1])
+        self._start = self.cell_start.tolist()
+        return self
+
+    def _cell(self, x, y):
+        ix = min(max(int((x - self._ox) // self.resolution), 0), self.shape[0]-1)
+        iy = min(max(int((y - self._oy) // self.resolution), 0), self.shape[1]-1)
+        return ix, iy
+
+    def segment_candidates(self, p, q):
+        """ Indices of the edges in the cells touched by the segment pq. An edge touching
+        several of these cells is listed once per cell """
+        (px, py), (qx, qy) = sorted((tuple(map(float, p[:2])), tuple(map(float, q[:2]))))
+        res, tol, (nx, ny) = self.resolution, self.tol, self.shape
+        c0 = max(int((px - tol - self._ox) // res), 0)
+        c1 = min(int((qx + tol - self._ox) // res), nx-1)
+
+        # Long segments are rasterized in one vectorized pass
+        if c1 - c0 > 8:
+            _, cells = segment_cells(p, q, self.origin, res, self.shape, tol)
+            starts   = self.cell_start[cells]
+            _, idx   = _expand(starts, self.cell_start[cells+1] - starts)
+            edges    = self.cell_edges[idx]
+        else:
+            chunks = []
+            for col in range(c0, c1+1):
+                xl = max(self._ox + col*res, px)
+                xr = min(self._ox + (col+1)*res, qx)
+                ya, yb = (py + (xl-px)*(qy-py)/(qx-px), py + (xr-px)*(qy-py)/(qx-px)) if qx > px else (py, qy)
+                r0 = max(int((min(ya, yb) - tol - self._oy) // res), 0)
+                r1 = min(int((max(ya, yb) + tol - self._oy) // res), ny-1)
+                for row in range(r0, r1+1):
+                    lo, hi = self._start[row*nx + col], self._start[row*nx + col + 1]
+                    if hi > lo: chunks.append(self.cell_edges[lo:hi])
+            edges = np.concatenate(chunks) if chunks else self.cell_edges[:0]
+
+        self.queries, self.candidates = self.queries + 1, self.candidates + len(edges)
+        return edges
+
+    def segment_pairs(self, p, q):
+        """ (segment, edge) candidate pairs for the (N, 2) segments pq, may contain duplicates """
+        seg, cells = segment_cells(p, q, self.origin, self.resolution, self.shape, self.tol)
+        starts     = self.cell_start[cells]
+        pair, idx  = _expand(starts, self.cell_start[cells+1] - starts)
+        self.queries, self.candidates = self.queries + len(p), self.candidates + len(idx)
+        return seg[pair], self.cell_edges[idx]
+
+    def ray_candidates(self, x, y):
+        """ Indices of the edges in the cells from q=(x,y) to the right end of its row. These
+        include every edge the ray from q towards +x crosses and every edge touching q.
+        An edge touching several of these cells is listed once per cell """
+        ix, iy = self._cell(x, y)
+        edges  = self.cell_edges[self._start[iy*self.shape[0] + ix]:self._start[(iy+1)*self.shape[0]]]
+        self.queries, self.candidates = self.queries + 1, self.candidates + len(edges)
+        return edges
+
+    def box_candidates(self, lo, hi):
+        """ Indices of the edges in the cells overlapping the box [lo, hi], each listed once """
+        (ix0, iy0), (ix1, iy1) = self._cell(*lo[:2]), self._cell(*hi[:2])
+        nx     = self.shape[0]
+        chunks = [self.cell_edges[self._start[iy*nx + ix0]:self._start[iy*nx + ix1 + 1]] for iy in range(iy0, iy1+1)]
+        edges  = np.unique(np.concatenate(chunks))
+        self.queries, self.candidates = self.queries + 1, self.candidates + len(edges)
+        return edges
+
+    def row(self, y):
+        """ Row of the grid containing height y """
+        return self._cell(self._ox, y)[1]
+
+    def row_candidates(self, iy):
+        """ Indices of the edges in all the cells of row iy, each listed once """
+        return np.unique(self.cell_edges[self._start[iy*self.shape[0]]:self._start[(iy+1)*self.shape[0]]])
+
+    def stats(self):
+        """ Build and query statistics for tuning the cell size """
+        counts = np.diff(self.cell_start)
+        return {'resolution': self.resolution, 'shape': self.shape,
+                'entries': int(counts.sum()), 'empty_cells': float((counts == 0).mean()),
+                'edges_per_cell': float(counts.mean()), 'max_edges_per_cell': int(counts.max()),
+                'queries': self.queries, 'candidates': self.candidates,
+                'candidates_per_query': self.candidates / max(self.queries, 1)}
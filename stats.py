@@ -0,0 +1,109 @@
+from __future__ import division
+
+import json
+import time
+import functools
+
+class _Timer:
+    """ Context manager adding the duration of its block to a [calls, seconds] entry """
+    __slots__ = ('entry', 't0')
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.entry[0] += 1
+        self.entry[1] += time.perf_counter() - self.t0
+
+class _NullTimer:
+    __slots__ = ()
+    def __enter__(self):    pass
+    def __exit__(self, *exc): pass
+
+class Stats:
+    """ Counters and per-phase wall-clock timers of a planner run.
+
+    Planners time their phases with 'with stats.timer(phase):', or in their search loop
+    with stats.add(phase, t0), and the geometry classes count the queries they answer with
+    stats.count(name, n). NULL_STATS (the default everywhere) ignores all of them. Hot
+    paths check 'enabled' first, so disabled instrumentation costs a single test.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.counters = {}
+        self.timers   = {} # phase -> [calls, seconds]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        return _Timer(self.timers.setdefault(name, [0, 0.]))
+
+    def add(self, name, t0):
+        """ Charges the time since t0 (from time.perf_counter) to the phase 'name'. Hot loops
+        use it behind an 'if stats.enabled' check, which is cheaper than a disabled timer """
+        entry = self.timers.setdefault(name, [0, 0.])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - t0
+
+    def merge(self, other):
+        """ Adds the counters and timers of another run, given as a dict from as_dict() """
+        for name, n in other['counters'].items(): self.count(name, n)
+        for name, t in other['timers'].items():
+            entry = self.timers.setdefault(name, [0, 0.])
+            entry[0] += t['calls']
+            entry[1] += t['seconds']
+
+    def as_dict(self):
+        return {'counters': dict(sorted(self.counters.items())),
+                'timers': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in sorted(self.timers.items())}}
+
+    def to_json(self, path):
+        with open(path, 'w') as f: json.dump(self.as_dict(), f, indent=1)
+
+    def __str__(self):
+        lines = ["%-20s %12d"%item for item in sorted(self.counters.items())]
+        lines += ["%-20s %12d calls %10.4fs %8.2fus/call"%(name, calls, seconds, 1e6*seconds/max(calls, 1))
+                  for name, (calls, seconds) in sorted(self.timers.items(), key=lambda t: -t[1][1])]
+        return "\n".join(lines)
+
+class NullStats:
+    """ Disabled Stats, every call is a no-op """
+    enabled  = False
+    _timer   = _NullTimer()
+
+    def count(self, name, n=1): pass
+    def timer(self, name):      return self._timer
+    def add(self, name, t0):    pass
+    def as_dict(self):          return {'counters': {}, 'timers': {}}
+
+NULL_STATS = NullStats()
+
+def restores_stats(plan):
+    """ Decorator of the planners, which set obstacles.stats while they run: the world gets
+    its previous stats back however the run ends, cancelled or failed included, so the
+    next query on a shared world is not counted into this run """
+    @functools.wraps(plan)
+    def wrapped(obstacles, *args, **kwargs):
+        previous = getattr(obstacles, 'stats', None)
+        try:
+            return plan(obstacles, *args, **kwargs)
+        finally:
+            if previous is not None: obstacles.stats = previous
+    return wrapped
+
+class TimedObserver:
+    """ Observer proxy charging the time of every drawing call to the 'plot' phase """
+    def __init__(self, observer, stats):
+        self.observer, self.stats = observer, stats
+
+    def __getattr__(self, name):
+        method = getattr(self.observer, name)
+        def timed(*args, **kwargs):
+            with self.stats.timer('plot'): return method(*args, **kwargs)
+        return timed
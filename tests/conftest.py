@@ -0,0 +1,3 @@
+""" Lets the tests import the planner modules from the repository root """
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,34 @@
+from __future__ import division
+import io, json, os
+
+import batch
+from obstacles import Obstacles
+from stats     import NULL_STATS
+from utilities import get_obstacle_course, get_start_and_goal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+def solve(world, queries, workers, **kwargs):
+    out    = io.StringIO()
+    solved = batch.run(world, queries, 'unidirectional', 20, 3000, workers=workers, out=out, log=None, **kwargs)
+    return solved, sorted((json.loads(line) for line in out.getvalue().splitlines()), key=lambda r: r['index'])
+
+def test_results_do_not_depend_on_the_workers(tmp_path):
+    """ Query i is seeded with seed + i, so a pool gives the same paths as an in-process run.
+    A start inside an obstacle, where the planner rejects every sample, times out alone and
+    the shared world keeps its stats """
+    world       = Obstacles(get_obstacle_course(os.path.join(ROOT, 'world_obstacles.txt')).to_polygons())
+    start, goal = get_start_and_goal(os.path.join(ROOT, 'start_goal.txt'))
+    path = str(tmp_path / 'queries.txt')
+    with open(path, 'w') as f:
+        f.write("# sx sy gx gy\n%d %d %d %d\n\n%d %d %d %d\n"%(start + goal + goal + start))
+    queries = batch.read_queries(path) + [((17, 40), goal)]
+
+    solved, inline = solve(world, queries, 0, timeout=2., with_stats=True)
+    assert solved == 2 and [r['success'] for r in inline] == [True, True, False]
+    assert inline[2]['error'] == 'timeout'
+    assert world.stats is NULL_STATS
+
+    _, pooled = solve(world, queries, 2, timeout=2., with_stats=True)
+    drop = lambda r: {k: v for k, v in r.items() if k not in ('timings', 'stats')}
+    assert list(map(drop, pooled)) == list(map(drop, inline))
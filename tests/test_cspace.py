@@ -0,0 +1,37 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+from cspace    import CSpaceSlices
+from obstacles import Obstacles
+from occupancy import FREE, OCCUPIED
+from utilities import get_obstacle_course
+
+shapely = pytest.importorskip('shapely')
+from shapely.geometry import Polygon
+from shapely.ops import unary_union
+from shapely.prepared import prep
+
+WORLD = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'world_obstacles.txt')
+
+def rectangle(x, y, alpha, hx, hy):
+    c, s = np.cos(alpha), np.sin(alpha)
+    return Polygon([(x + c*u - s*v, y + s*u + c*v) for u, v in ((-hx, -hy), (hx, -hy), (hx, hy), (-hx, hy))])
+
+def test_slices_match_the_footprint():
+    """ Poses in FREE cells keep the closed rectangle off every obstacle, poses in OCCUPIED
+    cells overlap one """
+    polygons = get_obstacle_course(WORLD).to_polygons()
+    world    = Obstacles(polygons)
+    slices   = CSpaceSlices(world, (10., 25.), slices=12, resolution=4.)
+    shapes   = prep(unary_union([Polygon(p) for p in polygons]))
+
+    rng    = np.random.RandomState(0)
+    poses  = np.c_[rng.uniform(world.bounds[0]-30, world.bounds[1]+30, (3000, 2)), rng.uniform(0, 2*np.pi, 3000)]
+    states = slices.lookup_batch(poses)
+    hits   = np.array([shapes.intersects(rectangle(x, y, a, 10., 25.)) for x, y, a in poses])
+
+    assert (states == FREE).any() and (states == OCCUPIED).any()
+    assert not hits[states == FREE].any() and hits[states == OCCUPIED].all()
+    assert [slices.lookup(*p) for p in poses[:500]] == states[:500].tolist()
@@ -0,0 +1,29 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+from freespace import Trapezoids
+from obstacles import Obstacles
+from utilities import get_obstacle_course
+
+shapely = pytest.importorskip('shapely')
+from shapely.geometry import Polygon, box
+from shapely.ops import unary_union
+
+WORLDS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, name)
+          for name in ('world_obstacles.txt', 'narrow_obstacles.txt')]
+
+@pytest.mark.parametrize('path', WORLDS)
+def test_trapezoids_cover_the_free_space(path):
+    """ Every sample is valid and the trapezoids add up to the free area of the box """
+    polygons = get_obstacle_course(path).to_polygons()
+    world    = Obstacles(polygons)
+    traps    = Trapezoids(world)
+    (x0, y0), (x1, y1) = traps.box
+    free     = box(x0, y0, x1, y1).difference(unary_union([Polygon(p) for p in polygons]))
+
+    assert np.isclose(traps.area, free.area)
+    samples = traps.sample(20000, np.random.RandomState(0))
+    assert world.point_is_valid_batch(samples).all()
+    assert ((samples >= traps.box[0]) & (samples <= traps.box[1])).all()
@@ -0,0 +1,79 @@
+from __future__ import division
+from math import log, pi
+import numpy as np
+import pytest
+from KDTree import KDTree, SE2KDTree
+
+def build(points, incremental):
+    """ Tree over the points, inserted one by one (with scapegoat rebuilds) or built at once """
+    if not incremental: return KDTree.from_points(points)
+    tree = KDTree(points[0])
+    for p in points[1:]: tree.addNode(p)
+    return tree
+
+def brute_force(points, queries):
+    """ (Q, N) distances from every query to every point """
+    return np.hypot(*(queries[:,None] - points[None]).transpose(2, 0, 1))
+
+def test_duplicates_stay_balanced():
+    """ Repeated points used to chain down one side, 3000 inserts gave depth 1005 """
+    tree = KDTree((5., 5.))
+    for _ in range(3000): tree.addNode((5., 5.))
+    assert tree.depth <= 2 * log(tree.n, 2)
+
+    tree = KDTree.from_points(np.full((3001, 2), 5.))
+    assert tree.depth <= 2 * log(tree.n, 2)
+
+@pytest.mark.parametrize('incremental', [False, True])
+@pytest.mark.parametrize('integer', [False, True])
+def test_queries_match_brute_force(incremental, integer):
+    """ nearestNode, k_nearest, within_radius and neighbours against a full scan. Integer
+    points repeat often, which exercises the keys equal to a split """
+    rng     = np.random.RandomState(0)
+    points  = rng.uniform(0, 50, (2000, 2))
+    queries = rng.uniform(-5, 55, (300, 2))
+    if integer: points, queries = np.round(points), np.round(queries)
+    tree    = build(points, incremental)
+    dists   = brute_force(points, queries)
+
+    for q, d in zip(queries, dists):
+        nearest, dist = tree.nearestNode(q)
+        assert np.isclose(dist, d.min()) and np.isclose(np.hypot(*(np.array(nearest) - q)), dist)
+
+        found = tree.k_nearest(q, 10)
+        assert np.allclose([dist for _, dist in found], np.sort(d)[:10])
+
+        found = tree.within_radius(q, 4.)
+        assert np.allclose([dist for _, dist in found], np.sort(d[d <= 4.]))
+
+        idx, dist = tree.neighbours(q, 10, radius=4.)
+        assert np.allclose(dist, np.sort(d[d <= 4.])[:10])
+        assert np.allclose(np.hypot(*(tree.points[idx] - q).T), dist)
+
+def test_se2_nearest_matches_brute_force():
+    """ SE2KDTree.nearestNode with a heading uses the weighted SE(2) distance, without one
+    the planar distance """
+    rng     = np.random.RandomState(1)
+    poses   = rng.uniform(0, 1, (2000, 3)) * [100, 100, 2*pi]
+    queries = rng.uniform(0, 1, (300, 3)) * [100, 100, 2*pi]
+    tree    = SE2KDTree.from_points(poses[:,:2], poses[:,2], weight=10.)
+    turn    = (queries[:,None,2] - poses[None,:,2] + pi) % (2*pi) - pi
+    dists   = np.sqrt(brute_force(poses[:,:2], queries[:,:2])**2 + (10.*turn)**2)
+    planar  = brute_force(poses[:,:2], queries[:,:2])
+
+    for q, d, p in zip(queries, dists, planar):
+        node, dist = tree.nearestNode(q[:2], q[2], return_node=True)
+        assert np.isclose(dist, d.min()) and node.alpha == poses[d.argmin(), 2]
+        assert np.isclose(tree.nearestNode(q[:2])[1], p.min())
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_nearest_batch_matches_brute_force(incremental):
+    rng     = np.random.RandomState(2)
+    points  = np.round(rng.uniform(0, 50, (2000, 2)))
+    queries = rng.uniform(-5, 55, (1000, 2))
+    tree    = build(points, incremental)
+    dists   = brute_force(points, queries)
+
+    best, dist = tree.nearest_batch(queries)
+    assert np.allclose(dist, dists.min(1))
+    assert np.allclose(np.hypot(*(tree.points[best] - queries).T), dist)
@@ -0,0 +1,64 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+from obstacles import Obstacles
+from utilities import get_obstacle_course
+
+shapely = pytest.importorskip('shapely')
+from shapely.geometry import Polygon, LineString, Point
+from shapely.ops import unary_union
+
+WORLD    = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'world_obstacles.txt')
+VARIANTS = [dict(index_resolution=0), dict(index_resolution=10.), dict(grid_resolution=5.),
+            dict(grid_resolution=5., index_resolution=10.)]
+
+@pytest.fixture(scope='module')
+def polygons():
+    return get_obstacle_course(WORLD).to_polygons()
+
+@pytest.fixture(scope='module')
+def shapes(polygons):
+    return unary_union([Polygon(p) for p in polygons])
+
+def random_points(polygons, n, seed, integer=False):
+    """ Points over the world's bounding box and a margin around it. Integer points often
+    land on the (integer) obstacle edges and vertices """
+    vertices = np.concatenate(polygons)
+    points   = np.random.RandomState(seed).uniform(vertices.min(0)-20, vertices.max(0)+20, (n, 2))
+    return np.round(points) if integer else points
+
+def random_segments(polygons, n, seed, integer=False, length=50.):
+    start = random_points(polygons, n, seed)
+    step  = np.random.RandomState(seed+1).normal(size=(n, 2))
+    segs  = np.stack([start, start + step * length / np.hypot(*step.T)[:,None]], 1)
+    return np.round(segs) if integer else segs
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('kwargs', VARIANTS)
+def test_segments_match_shapely(polygons, shapes, kwargs, integer):
+    """ Single and batched segment checks agree with shapely, with and without the edge index.
+    Segments are tested against the obstacle edges only, like the planners do """
+    world    = Obstacles(polygons, **kwargs)
+    segments = random_segments(polygons, 2000, 0, integer)
+    expected = np.array([shapes.boundary.intersects(LineString(s)) for s in segments])
+    single   = np.array([world.check_collisions(s) for s in segments])
+
+    assert expected.any() and not expected.all()
+    assert (single == expected).all()
+    assert (world.check_collisions_batch(segments) == expected).all()
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('kwargs', VARIANTS)
+def test_points_match_shapely(polygons, shapes, kwargs, integer):
+    """ Single and batched point checks agree with shapely, with and without the edge index
+    and the occupancy grid. Points on an edge are not valid """
+    world    = Obstacles(polygons, **kwargs)
+    points   = random_points(polygons, 3000, 1, integer)
+    expected = np.array([not shapes.intersects(Point(*p)) for p in points])
+    single   = np.array([world.point_is_valid(*p) for p in points])
+
+    assert expected.any() and not expected.all()
+    assert (single == expected).all()
+    assert (world.point_is_valid_batch(points) == expected).all()
@@ -0,0 +1,43 @@
+from __future__ import division
+import json, os, threading
+from urllib.request import urlopen, Request
+import pytest
+
+from server    import PlanningServer, load_worlds
+from utilities import get_start_and_goal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+@pytest.fixture(scope='module')
+def server():
+    worlds, roadmaps = load_worlds([os.path.join(ROOT, 'world_obstacles.txt')])
+    server = PlanningServer(('127.0.0.1', 0), worlds, roadmaps, workers=1, timeout=5.)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def post(server, body):
+    request = Request('http://127.0.0.1:%d/plan'%server.server_address[1], json.dumps(body).encode(),
+                      {'Content-Type': 'application/json'})
+    return json.loads(urlopen(request).read())
+
+@pytest.mark.parametrize('request_', [[1, 2], {'mode': 'nope'}, {'world': 'nope'}, {'start': [1, 2]},
+                                      {'start': [1, 2], 'goal': [1, True]}, {'start': [1, 2, 3], 'goal': [1, 2]},
+                                      {'mode': 'extra', 'start': [1, 2], 'goal': [3, 4]},
+                                      {'start': [1, 2], 'goal': [3, 4], 'step_size': 0}])
+def test_bad_requests_are_rejected(server, request_):
+    code, reply = server.plan(request_)
+    assert code == 400 and reply['error']
+
+def test_plan_over_http(server):
+    start, goal = get_start_and_goal(os.path.join(ROOT, 'start_goal.txt'))
+    reply = post(server, {'mode': 'bidirectional', 'start': list(start), 'goal': list(goal), 'step_size': 20,
+                          'seed': 3, 'stats': True})
+    assert reply['success'] and reply['path'][0] == list(start) and reply['path'][-1] == list(goal)
+    assert reply['stats']['counters']
+
+    metrics = json.loads(urlopen('http://127.0.0.1:%d/metrics'%server.server_address[1]).read())
+    assert metrics['solved'] >= 1 and metrics['modes']['bidirectional'] >= 1 and metrics['in_flight'] == 0
@@ -0,0 +1,24 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+import smoothing
+import unidirectionalrrt
+from obstacles import Obstacles
+from utilities import get_obstacle_course, get_start_and_goal, path_length
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_shortcut_keeps_the_path_free(seed):
+    """ The shortcut path joins the same start and goal, is collision free and not longer """
+    world       = Obstacles(get_obstacle_course(os.path.join(ROOT, 'world_obstacles.txt')).to_polygons())
+    start, goal = get_start_and_goal(os.path.join(ROOT, 'start_goal.txt'))
+    result      = unidirectionalrrt.plan(world, start, goal, 20, 5000, rng=np.random.RandomState(seed))
+    assert result.path
+
+    path = smoothing.shortcut(world, result.path, budget=0.02, rng=np.random.RandomState(seed))
+    assert np.allclose(path[0], result.path[0][:2]) and np.allclose(path[-1], result.path[-1][:2])
+    assert not world.check_collisions_batch(np.stack([path[:-1], path[1:]], 1)).any()
+    assert path_length(path) <= path_length(result.path) + 1e-9
@@ -0,0 +1,60 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+from obstacles import Obstacles, segments_intersect
+from occupancy import OccupancyGrid, FREE, OCCUPIED
+from spatial   import EdgeGrid
+from utilities import get_obstacle_course
+
+WORLD = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'world_obstacles.txt')
+
+@pytest.fixture(scope='module')
+def world():
+    return Obstacles(get_obstacle_course(WORLD).to_polygons(), index_resolution=0)
+
+def random_segments(world, n, seed, length):
+    rng   = np.random.RandomState(seed)
+    start = rng.uniform(world.bounds[0]-20, world.bounds[1]+20, (n, 2))
+    step  = rng.normal(size=(n, 2))
+    return np.stack([start, start + step * rng.uniform(0, length, (n, 1)) / np.hypot(*step.T)[:,None]], 1)
+
+@pytest.mark.parametrize('resolution', [None, 7., 23.])
+def test_edge_grid_candidates_cover_hits(world, resolution):
+    """ Every edge a segment, ray or box actually touches is among the index candidates """
+    grid     = EdgeGrid(world.edges, resolution)
+    segments = random_segments(world, 500, 0, 200.)
+    e0, e1   = world.edges[:,0], world.edges[:,1]
+
+    seg, edge = grid.segment_pairs(segments[:,0], segments[:,1])
+    pairs     = set(zip(seg.tolist(), edge.tolist()))
+    for i, (p, q) in enumerate(segments):
+        hits = set(np.flatnonzero(segments_intersect(p, q, e0, e1)).tolist())
+        assert hits <= set(grid.segment_candidates(p, q).tolist())
+        assert hits <= set(e for s, e in pairs if s == i)
+
+        # The ray from p towards +x, past the right end of the world
+        end  = np.array([world.bounds[1][0] + 100., p[1]])
+        hits = set(np.flatnonzero(segments_intersect(p, end, e0, e1)).tolist())
+        assert hits <= set(grid.ray_candidates(*p).tolist())
+
+        # An edge touches the box if it crosses one of its sides or has an endpoint inside
+        lo, hi  = np.minimum(p, q), np.maximum(p, q)
+        corners = np.array([lo, [hi[0], lo[1]], hi, [lo[0], hi[1]]])
+        cross   = segments_intersect(corners[:,None], np.roll(corners, -1, 0)[:,None], e0, e1).any(0)
+        inside  = ((e0 >= lo) & (e0 <= hi)).all(1) | ((e1 >= lo) & (e1 <= hi)).all(1)
+        assert set(np.flatnonzero(cross | inside).tolist()) <= set(grid.box_candidates(lo, hi).tolist())
+
+@pytest.mark.parametrize('resolution', [2., 5., 13.])
+def test_occupancy_grid_cells_are_exact(world, resolution):
+    """ FREE and OCCUPIED cells hold only valid and only invalid points respectively, so
+    just BOUNDARY cells need the exact test """
+    grid   = OccupancyGrid(world, resolution)
+    points = np.random.RandomState(1).uniform(world.bounds[0]-20, world.bounds[1]+20, (20000, 2))
+    states = grid.lookup_batch(points)
+    valid  = world.point_is_valid_batch(points)
+
+    assert (states == FREE).any() and (states == OCCUPIED).any()
+    assert valid[states == FREE].all() and not valid[states == OCCUPIED].any()
+    assert [grid.lookup(*p) for p in points[:500]] == states[:500].tolist()
@@ -0,0 +1,27 @@
+from __future__ import division
+import os
+import numpy as np
+import pytest
+
+from obstacles  import Obstacles
+from utilities  import get_obstacle_course, get_start_and_goal
+from visibility import VisibilityPolygon
+
+ROOT   = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+WORLDS = [('world_obstacles.txt', 'start_goal.txt'), ('narrow_obstacles.txt', 'narrow_start_goal.txt')]
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('obstacle_path, goal_path', WORLDS)
+def test_visible_matches_segment_check(obstacle_path, goal_path, integer):
+    """ visible(q) agrees with the exact check of the segment from the origin to q, also for
+    integer points, which often line up with edges and vertices """
+    world       = Obstacles(get_obstacle_course(os.path.join(ROOT, obstacle_path)).to_polygons())
+    start, goal = get_start_and_goal(os.path.join(ROOT, goal_path))
+    points      = np.random.RandomState(0).uniform(world.bounds[0]-50, world.bounds[1]+50, (5000, 2))
+    if integer: points = np.round(points)
+
+    for origin in (start, goal):
+        region   = VisibilityPolygon(world, origin)
+        expected = ~world.check_collisions_batch(np.stack([np.repeat([origin], len(points), 0), points], 1))
+        assert expected.any() and not expected.all()
+        assert [region.visible(q) for q in points] == expected.tolist()
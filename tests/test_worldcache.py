@@ -0,0 +1,38 @@
+from __future__ import division
+import os, shutil
+import numpy as np
+
+import worldcache
+from obstacles import Obstacles
+from utilities import get_obstacle_course
+
+WORLD = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'world_obstacles.txt')
+
+def answers(world, rng):
+    """ Point and segment checks of the world at random points, for comparing two worlds """
+    points = rng.uniform(world.bounds[0]-20, world.bounds[1]+20, (2000, 2))
+    segs   = np.stack([points, points + rng.normal(0, 30, points.shape)], 1)
+    return (world.point_is_valid_batch(points).tolist(), [world.point_is_valid(*p) for p in points],
+            world.check_collisions_batch(segs).tolist(), [world.check_collisions(s) for s in segs])
+
+def test_compiled_world_matches_the_text(tmp_path):
+    """ A world loaded back from its compiled file answers like one parsed from the text, and
+    editing the text recompiles it """
+    path = str(tmp_path / 'world.txt')
+    shutil.copy(WORLD, path)
+    built    = worldcache.load_world(path, grid_resolution=5., index_resolution=10.)
+    compiled = worldcache.cache_path(path)
+    assert os.path.exists(compiled)
+
+    loaded   = worldcache.load_world(path, grid_resolution=5., index_resolution=10.)
+    expected = answers(Obstacles(get_obstacle_course(WORLD).to_polygons()), np.random.RandomState(0))
+    assert answers(built, np.random.RandomState(0)) == expected
+    assert answers(loaded, np.random.RandomState(0)) == expected
+
+    # Drop the last obstacle from the file
+    with open(WORLD) as f: lines = f.read().splitlines()
+    count = int(lines[0])
+    last  = max(i for i, line in enumerate(lines) if len(line.split()) == 1 and i > 0)
+    with open(path, 'w') as f: f.write('\n'.join([str(count-1)] + lines[1:last]) + '\n')
+    edited = worldcache.load_world(path, grid_resolution=5., index_resolution=10.)
+    assert len(edited.edges) < len(loaded.edges)
@@ -74,8 +74,8 @@ def gen_rand(low, high, size):
     return np.concatenate(arrs, 1)
 
 if __name__ == '__main__':
-    obstacle_path, goal_path = "../hw3/world_obstacles.txt", "../hw3/goal.txt"
-    # obstacle_path, goal_path = "world_obstacles.txt", "start_goal.txt"
+    # obstacle_path, goal_path = "../hw3/world_obstacles.txt", "../hw3/goal.txt"
+    obstacle_path, goal_path = "world_obstacles.txt", "start_goal.txt"
     path = get_obstacle_course(obstacle_path)
     start, goal = get_start_and_goal(goal_path)
 
@@ -100,6 +100,10 @@ if __name__ == '__main__':
     my_ans = [obstacles.check_collisions(paths[i].vertices) for i in range(num_tests)]
     ex_ans = [shapely_intersect(paths[i].vertices) for i in range(num_tests)]
 
+    # Vectorized batch API must agree with the per-segment answers
+    batch_ans = obstacles.check_collisions_batch(np.stack([starts, ends], 1))
+    assert (batch_ans == np.array(my_ans)).all(), "Batch mismatches : %d"%(batch_ans != np.array(my_ans)).sum()
+
     correct_positives, correct_negatives = [], []
     false_positives, false_negatives = [], []
     for i in range(num_tests):
@@ -114,7 +118,6 @@ if __name__ == '__main__':
     for idx in false_negatives:
         print(idx, Line(Point(*paths[idx].vertices[0]), Point(*paths[idx].vertices[1])), my_ans[idx], ex_ans[idx])
 
-    %matplotlib notebook
     fig, ax = plt.subplots()
     draw_obstacle_course(path, ax)
     draw_start_and_goal(start, goal, ax)
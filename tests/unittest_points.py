@@ -74,8 +74,8 @@ def gen_rand(low, high, size):
     return np.concatenate(arrs, 1)
 
 if __name__ == '__main__':
-    obstacle_path, goal_path = "../hw3/world_obstacles.txt", "../hw3/goal.txt"
-    # obstacle_path, goal_path = "world_obstacles.txt", "start_goal.txt"
+    # obstacle_path, goal_path = "../hw3/world_obstacles.txt", "../hw3/goal.txt"
+    obstacle_path, goal_path = "world_obstacles.txt", "start_goal.txt"
     path = get_obstacle_course(obstacle_path)
     start, goal = get_start_and_goal(goal_path)
 
@@ -92,6 +92,10 @@ if __name__ == '__main__':
     my_ans = [not obstacles.point_is_valid(*points[i]) for i in range(num_tests)]
     ex_ans = [shapely_contains(points[i]) for i in range(num_tests)]
 
+    # Vectorized batch API must agree with the per-point answers
+    batch_ans = ~obstacles.point_is_valid_batch(points)
+    assert (batch_ans == np.array(my_ans)).all(), "Batch mismatches : %d"%(batch_ans != np.array(my_ans)).sum()
+
     correct_positives, correct_negatives = [], []
     false_positives, false_negatives = [], []
     for i in range(num_tests):
@@ -106,7 +110,6 @@ if __name__ == '__main__':
     for i in false_positives: print(points[i], my_ans[i], ex_ans[i])
     for i in false_negatives: print(points[i], my_ans[i], ex_ans[i])
 
-    %matplotlib notebook
     fig, ax = plt.subplots()
     draw_obstacle_course(path, ax)
     draw_start_and_goal(start, goal, ax)
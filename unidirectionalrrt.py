@@ -1,43 +1,70 @@
 from __future__ import division
 
 import math
+import time
 import numpy as np
 
 from KDTree    import KDTree
 from obstacles import Obstacles
-from utilities import gen_next, PathTree
-
-def run(obstacles, start, goal, step_size, max_size, plotter):
+from plotters  import NullPlotter
+from samplers  import GOAL_BIAS, UniformSampler, take_goal
+from stats     import NULL_STATS, TimedObserver, restores_stats
+from utilities import gen_next, PathTree, PlannerResult
+from visibility import VisibilityPolygon
+
+# Lazy trees only look for the goal from within this many step sizes of it
+LAZY_GOAL_STEPS = 3
+
+@restores_stats
+def plan(obstacles, start, goal, step_size, max_size, observer=None, rng=None, stats=None, lazy=False,
+         sampler=None, goal_bias=GOAL_BIAS):
+    """ Grows a RRT from start until it sees the goal, reporting progress to 'observer'
+    and the time spent in each phase to 'stats'. Whether a node sees the goal is looked up
+    in the visibility polygon of the goal, built once per query. Random points come from
+    sampler(obstacles, rng=rng) (a UniformSampler by default), or are the goal itself with
+    probability goal_bias.
+
+    With lazy=True, new edges are added after only checking their end point and the goal
+    is only looked for from nearby. Once a node sees the goal, the unchecked edges on its
+    path are checked from the root down. The subtree under the first colliding edge is
+    reattached to a nearby node if possible, otherwise cut off so that the tree grows back
+    around the obstacle. Only edges on candidate paths are ever checked """
+    observer  = observer if observer is not None else NullPlotter()
+    rng       = rng if rng is not None else np.random
+    stats     = stats if stats is not None else NULL_STATS
+    timed     = stats.enabled # The phases of the search loop are only timed if set
+    if timed: observer = TimedObserver(observer, stats)
+    t_start   = time.perf_counter()
     circ_rad  = min(step_size/5, 5)
     final_pos = np.array(goal[:2])
-
-    # Pre-compute for generating new random points in Q_free
-    minp, maxp   = obstacles.vertices.min(0), obstacles.vertices.max(0)
-    span, offset = (maxp-minp)*1.1, minp-(maxp-minp)*0.05
-
-    def gen_valid_rand(valid_function):
-        """ Generates a valid q_rand in Q_free given a validity function """
-        tmp     = np.random.random(2) * span + offset
-        while not valid_function(*tmp):
-            tmp = np.random.random(2) * span + offset
-        return tmp
+    goal      = tuple(goal[:2])
 
     KD    = KDTree(start)
     RRT   = PathTree(start)
-    circ1 = plotter.draw_circle(start, 1, time=1, zorder=5)
-    obstacles = Obstacles(obstacles.to_polygons())
-
-    trials = 0
-    while KD.length < max_size:
+    circ1 = observer.draw_circle(start, 1, time=1, zorder=5)
+    if not isinstance(obstacles, Obstacles): obstacles = Obstacles(obstacles.to_polygons())
+    sampler   = (sampler or UniformSampler)(obstacles, rng=rng)
+    with stats.timer('visibility'):
+        view  = VisibilityPolygon(obstacles, goal)
+    t_search  = time.perf_counter()
+    obstacles.stats = stats
+
+    trials, found, expanded = 0, False, 0
+    checked, artists = set(), {} # Lazy mode: nodes whose parent edge is checked, their drawings
+    while expanded < max_size:
         trials += 1
         circ1.remove()
 
         # Select a random point q_rand \in Q_free
-        q_rand = gen_valid_rand(obstacles.point_is_valid) if np.random.randint(0, 100)>5 else final_pos
-        circ1 = plotter.draw_circle(q_rand, 5, time=0.01, zorder=5)
+        if timed: t0 = time.perf_counter()
+        q_rand = final_pos if take_goal(rng, goal_bias) else sampler.sample()
+        if timed: stats.add('sample', t0)
+        circ1 = observer.draw_circle(q_rand, 5, time=0.01, zorder=5)
             
         # Find the nearest node and distance to it
+        if timed: t0 = time.perf_counter()
         q_near, dist = KD.nearestNode(q_rand)
+        if timed: stats.add('nearest', t0)
         
         # Generate the next node in the direction of q_rand
         if dist < step_size:
@@ -45,40 +72,124 @@ def run(obstacles, start, goal, step_size, max_size, plotter):
             q_next = tuple(q_rand)
         else:
             q_next = gen_next(q_near, q_rand, step_size)
-            if not obstacles.point_is_valid(*q_next): continue
+            if timed: t0 = time.perf_counter()
+            valid = obstacles.point_is_valid(*q_next)
+            if timed: stats.add('point_check', t0)
+            if not valid: continue
         
         # Check validity and update tree
-        if obstacles.check_collisions((q_near, q_next)): continue
-
+        if lazy and q_next in RRT: continue # Lazy cuts need every node stored once
+        if not lazy:
+            if timed: t0 = time.perf_counter()
+            collides = obstacles.check_collisions((q_near, q_next))
+            if timed: stats.add('collision', t0)
+            if collides: continue
+
+        if timed: t0 = time.perf_counter()
         KD.addNode(q_next)
         RRT.addPath(q_near, q_next)
-
-        plotter.draw_line(q_near, q_next, color='k', zorder=1, update=False)
-        plotter.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=2)
-
-        if not obstacles.check_collisions((q_next, goal)):
+        if timed: stats.add('insert', t0)
+        expanded += 1
+
+        line = observer.draw_line(q_near, q_next, color='k', zorder=1, update=False)
+        circ = observer.draw_circle(q_next, circ_rad, edgecolor='k', facecolor='w', zorder=2)
+        if lazy: artists[q_next] = (line, circ)
+
+        # The line to the goal ends the candidate path of lazy trees
+        collides = lazy and math.hypot(q_next[0]-goal[0], q_next[1]-goal[1]) > LAZY_GOAL_STEPS*step_size
+        if not collides:
+            if timed: t0 = time.perf_counter()
+            collides = not view.visible(q_next)
+            if timed: stats.add('goal_line', t0)
+        if not collides and lazy:
+            if timed: t0 = time.perf_counter()
+            blocked = _first_collision(obstacles, RRT.pathTo(q_next), checked)
+            if timed: stats.add('validate', t0)
+            if blocked is not None:
+                if timed: t0 = time.perf_counter()
+                removed = _repair(obstacles, KD, RRT, blocked, checked)
+                if removed:
+                    KD.remove(removed)
+                    for q in removed:
+                        checked.discard(q)
+                        for artist in artists.pop(q): artist.remove()
+                else:
+                    artists[blocked][0].remove()
+                    artists[blocked] = (observer.draw_line(RRT[blocked].parent, blocked, color='k',
+                                                           zorder=1, update=False), artists[blocked][1])
+                if timed: stats.add('repair', t0)
+                stats.count('lazy_repairs' if not removed else 'lazy_cuts')
+                stats.count('lazy_removed', len(removed))
+                continue
+        if not collides:
             # IF there is a direct line to the goal, then TAKE IT
             goal_distance = math.hypot(q_next[0]-goal[0], q_next[1]-goal[1])
             while goal_distance > 0:
-                q_new = gen_next(q_next, goal, min(goal_distance, step_size))
+                q_new = gen_next(q_next, goal, step_size) if goal_distance > step_size else goal
                 RRT.addPath(q_next, q_new)
-                plotter.draw_line(q_next, q_new, color='k', zorder=1, update=False)
-                plotter.draw_circle(q_new, circ_rad, edgecolor='k', facecolor='w', zorder=2)
+                observer.draw_line(q_next, q_new, color='k', zorder=1, update=False)
+                observer.draw_circle(q_new, circ_rad, edgecolor='k', facecolor='w', zorder=2)
                 q_next = q_new
                 goal_distance -= step_size
+            found = True
             break
 
         trials = 0
 
-    print("n =", KD.length)
-
-    cur = RRT[goal]
-    while cur.parent:
-        plotter.draw_line(cur, cur.parent, update=False, color='b', zorder=3)
+    t_end   = time.perf_counter()
+    stats.count('samples_drawn', sampler.drawn)
+    stats.count('samples_rejected', sampler.rejected)
+    stats.count('kd_rebuilds', KD.rebuilds)
+    timings = {'setup': t_search-t_start, 'search': t_end-t_search, 'total': t_end-t_start}
+    path    = RRT.pathTo(goal) if found else None
+    return PlannerResult(path, RRT, expanded, timings)
+
+def _repair(obstacles, KD, RRT, node, checked, tries=3):
+    """ Reattaches the subtree of 'node', whose edge to its parent collides, to one of the
+    'tries' nearest nodes outside it with a free edge. Otherwise the subtree is cut off.
+    Returns the coords of the removed nodes """
+    subtree, stack = set(), [RRT[node]]
+    while stack:
+        cur = stack.pop()
+        subtree.add(cur.coords)
+        stack += cur.children
+
+    for q, _ in KD.k_nearest(node, len(subtree) + tries):
+        if q in subtree or q == RRT[node].parent.coords: continue
+        if not obstacles.check_collisions((q, node)):
+            RRT.changeParent(node, q)
+            checked.add(node)
+            return []
+        tries -= 1
+        if tries == 0: break
+    return RRT.removeSubtree(node)
+
+def _first_collision(obstacles, path, checked):
+    """ Checks the edges of 'path' whose end node is not in 'checked', from the root down.
+    Returns the end node of the first colliding edge, None if the whole path is free """
+    for parent, node in zip(path, path[1:]):
+        if node in checked: continue
+        if obstacles.check_collisions((parent, node)): return node
+        checked.add(node)
+    return None
+
+def draw_path(path, plotter, circ_rad, color='b'):
+    """ Highlights the final path on the plotter """
+    for cur, parent in zip(path[1:], path):
+        plotter.draw_line(cur, parent, update=False, color=color, zorder=3)
         plotter.draw_circle(cur, circ_rad*1.5, update=False, facecolor='xkcd:green', edgecolor='k', zorder=4)
-        cur = cur.parent
     plotter.update()
 
+def run(obstacles, start, goal, step_size, max_size, plotter=None, stats=None, lazy=False, sampler=None,
+        goal_bias=GOAL_BIAS):
+    result = plan(obstacles, start, goal, step_size, max_size, plotter, stats=stats, lazy=lazy,
+                  sampler=sampler, goal_bias=goal_bias)
+    print("n =", result.n)
+
+    if result.success and plotter is not None:
+        draw_path(result.path, plotter, min(step_size/5, 5))
+    return result
+
 if __name__ == '__main__':
     from ImageGenerator import ImageGenerator
     from utilities      import get_obstacle_course, get_start_and_goal
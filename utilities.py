@@ -37,12 +37,34 @@ def gen_next(q_near, q_rand, scale=20):
     y = q_near[1] + vec[1] * scale / norm
     return (x, y)
 
+def path_length(path):
+    """ Total euclidean length of a sequence of (x, y, ...) states """
+    return sum(math.hypot(b[0]-a[0], b[1]-a[1]) for a, b in zip(path, path[1:]))
+
+class PlannerResult:
+    """ Outcome of a planner run: the path (None if not found), search tree(s),
+    number of nodes expanded and wall-clock timings in seconds """
+    def __init__(self, path, tree, n, timings):
+        self.path    = path
+        self.tree    = tree
+        self.n       = n
+        self.timings = timings
+
+    success = property(lambda self: self.path is not None)
+    length  = property(lambda self: path_length(self.path) if self.success else float('inf'))
+
+    def __str__(self):
+        return "n = %d, success = %s, length = %.2f, time = %.3fs"%(
+                    self.n, self.success, self.length, self.timings['total'])
+
 # trees.py
 class PathNode:
     def __init__(self, coords=None, parent=None):
         self.coords   = coords
         self.children = []
         self.parent   = parent
+        self.cost     = 0 if parent is None else parent.cost + \
+                            math.hypot(coords[0]-parent[0], coords[1]-parent[1])
     
     __str__     = lambda self:    str(self.coords)
     __getitem__ = lambda self, x: self.coords[x]
@@ -62,6 +84,40 @@ class PathTree:
         
     __getitem__  = lambda self, x: self.dict[x]
     __contains__ = lambda self, x: x in self.dict
+
+    def changeParent(self, end, start):
+        """ Moves 'end' (and its subtree) under 'start', propagating the new path costs """
+        node, parent = self.dict[end], self.dict[start]
+        node.parent.children.remove(node)
+        node.parent = parent
+        parent.addChild(node)
+
+        stack = [node]
+        while stack:
+            cur = stack.pop()
+            cur.cost = cur.parent.cost + math.hypot(cur[0]-cur.parent[0], cur[1]-cur.parent[1])
+            stack += cur.children
+
+    def removeSubtree(self, end):
+        """ Detaches 'end' from its parent and forgets it and all its descendants.
+        Returns the coords of the removed nodes """
+        node = self.dict[end]
+        node.parent.children.remove(node)
+        removed, stack = [], [node]
+        while stack:
+            cur = stack.pop()
+            removed.append(cur.coords)
+            del self.dict[cur.coords]
+            stack += cur.children
+        return removed
+
+    def pathTo(self, end):
+        """ Returns the list of coords from the root to 'end' """
+        cur, path = self.dict[end], []
+        while cur is not None:
+            path.append(cur.coords)
+            cur = cur.parent
+        return path[::-1]
         
     def printTree(self, node, depth=0, newNode=None):
         if node is None: return
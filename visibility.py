@@ -0,0 +1,126 @@
+from __future__ import division
+
+import math
+from bisect import bisect_right
+import numpy as np
+
+from samplers import sampling_box
+
+class VisibilityPolygon:
+    """ Region seen from a fixed point 'origin' (the goal or start of a query), computed
+    once with an angular sweep over the obstacle edges and clipped to 'box'.
+
+    The angles of all edge endpoints (and box corners) around the origin split the plane
+    into sectors that no endpoint lies strictly inside, so every edge crossing a sector
+    spans it whole. The ray distance to the nearest edge is computed at every sector
+    boundary, which gives one chord per sector. Since the free part of a sector is the
+    intersection of convex half-planes, everything between the origin and its chord is
+    visible; if the same edge is nearest at both ends, everything beyond it is hidden.
+    A lookup is thus a binary search over the sector angles and one orientation test.
+    Only points beyond the chord of a sector with two different nearest edges (where
+    obstacles cross) or outside the box need the exact segment test """
+    chunk_size = 4096 # Edges swept at once, nearer chunks first so that far edges are culled
+
+    def __init__(self, obstacles, origin, box=None):
+        self.obstacles = obstacles
+        self.origin    = (float(origin[0]), float(origin[1]))
+        o = np.array(self.origin)
+        box    = box if box is not None else sampling_box(obstacles)
+        lo, hi = np.minimum(box[0], o) - 1 - o, np.maximum(box[1], o) + 1 - o
+        self.box = (lo + o, hi + o)
+
+        # Edges relative to the origin, oriented counter-clockwise around it
+        a, b = obstacles.edges[:,0] - o, obstacles.edges[:,1] - o
+        cr   = a[:,0]*b[:,1] - a[:,1]*b[:,0]
+        a, b = np.where((cr < 0)[:,None], b, a), np.where((cr < 0)[:,None], a, b)
+        cr, d = np.abs(cr), b - a
+        na, nb = np.hypot(*a.T), np.hypot(*b.T)
+        t    = np.clip(-(a*d).sum(1) / np.maximum((d*d).sum(1), 1e-300), 0, 1)
+        dist = np.hypot(*(a + t[:,None]*d).T)
+
+        corners = np.array([lo, [hi[0], lo[1]], hi, [lo[0], hi[1]]])
+        phi_a, phi_b = np.arctan2(a[:,1], a[:,0]), np.arctan2(b[:,1], b[:,0])
+        theta  = np.unique(np.r_[phi_a, phi_b, np.arctan2(corners[:,1], corners[:,0]), -np.pi, np.pi])
+        ux, uy = np.cos(theta), np.sin(theta)
+        m      = len(theta) - 1
+
+        # Ray distances to the box, then to the nearest edge spanning each boundary angle
+        with np.errstate(divide='ignore'):
+            R = np.minimum(np.where(ux > 0, hi[0]/ux, np.where(ux < 0, lo[0]/ux, np.inf)),
+                           np.where(uy > 0, hi[1]/uy, np.where(uy < 0, lo[1]/uy, np.inf)))
+        wins = [] # (edge, boundary, distance) pairs that were the nearest when swept
+
+        # Index ranges of the boundary angles spanned by each edge, split at +-pi
+        ia, ib = np.searchsorted(theta, phi_a), np.searchsorted(theta, phi_b)
+        wrap   = ib < ia
+        ids    = np.r_[np.arange(len(a)), np.flatnonzero(wrap)]
+        first  = np.r_[ia, np.zeros(wrap.sum(), int)]
+        last   = np.r_[np.where(wrap, m, ib), ib[wrap]]
+
+        order = np.argsort(dist[ids], kind='stable')
+        for s in range(0, len(order), self.chunk_size):
+            sel = order[s:s+self.chunk_size]
+            e, l, h = ids[sel], first[sel], last[sel]
+
+            # Edges farther than every current distance in their range cannot be nearest.
+            # Sorted by range start, the reductions between the ranges cover R at most once
+            by_start = np.argsort(l, kind='stable')
+            e, l, h  = e[by_start], l[by_start], h[by_start]
+            far  = np.maximum.reduceat(np.r_[R, -np.inf], np.stack([l, h+1], 1).ravel())[::2]
+            keep = dist[e] < far
+            if not keep.any(): continue
+            e, l, h = e[keep], l[keep], h[keep]
+
+            n  = h - l + 1
+            ev = np.repeat(l - np.cumsum(n) + n, n) + np.arange(n.sum())
+            ee = np.repeat(e, n)
+            den = ux[ev]*d[ee,1] - uy[ev]*d[ee,0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = np.where(den > 0, cr[ee] / den, np.minimum(na[ee], nb[ee]))
+            r = np.clip(r, dist[ee], np.maximum(na[ee], nb[ee]))
+            # Exact at the endpoints, so that edges sharing a vertex tie there
+            r = np.where(ev == ia[ee], na[ee], np.where(ev == ib[ee], nb[ee], r))
+
+            np.minimum.at(R, ev, r)
+            win = r == R[ev]
+            wins.append((ee[win], ev[win], r[win]))
+        R[0] = R[m] = min(R[0], R[m]) # -pi and pi are the same ray
+
+        # Sectors whose both ends are nearest to the same edge are hidden beyond their chord
+        pure = np.zeros(m, bool)
+        if wins:
+            ee, ev, r = (np.concatenate(w) for w in zip(*wins))
+            ee, ev = ee[r == R[ev]], ev[r == R[ev]]
+            order  = np.lexsort((ev, ee))
+            ee, ev = ee[order], ev[order]
+            pure[ev[:-1][(ee[1:] == ee[:-1]) & (ev[1:] == ev[:-1] + 1)]] = True
+
+        # Chords (ax, ay, bx, by) between consecutive boundaries, relative to the origin
+        A = np.stack([ux*R, uy*R], 1)
+        chords = np.c_[A[:-1], A[1:]]
+        scale  = np.hypot(*(A[1:] - A[:-1]).T) * np.maximum(R[:-1], np.maximum(R[1:], 1))
+        self.theta  = theta
+        self.R      = R
+        self._theta  = theta.tolist()
+        self._chords = chords.tolist()
+        self._tol    = (1e-9 * scale).tolist()
+        self._pure   = pure.tolist()
+        self.sectors = m
+
+    def vertices(self):
+        """ Boundary of the polygon as an (N, 2) array, counter-clockwise """
+        return np.array(self.origin) + np.stack([np.cos(self.theta)*self.R, np.sin(self.theta)*self.R], 1)
+
+    def visible(self, q):
+        """ Returns whether the segment from the origin to q=(x,y) is collision free """
+        stats = self.obstacles.stats
+        if stats.enabled: stats.count('visibility_queries')
+        x, y = q[0] - self.origin[0], q[1] - self.origin[1]
+        i = min(max(bisect_right(self._theta, math.atan2(y, x)) - 1, 0), self.sectors - 1)
+        ax, ay, bx, by = self._chords[i]
+        side = (bx-ax)*(y-ay) - (by-ay)*(x-ax)
+        if side >  self._tol[i]: return True
+        if side < -self._tol[i] and self._pure[i]: return False
+
+        if stats.enabled: stats.count('visibility_fallbacks')
+        return not self.obstacles.check_collisions((self.origin, q[:2]))
@@ -0,0 +1,141 @@
+from __future__ import division
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+
+from obstacles import Obstacles
+from occupancy import OccupancyGrid
+from spatial   import EdgeGrid
+from utilities import get_obstacle_course
+
+# File layout: magic, header length (8 bytes little endian), JSON header, then the arrays,
+# each aligned to ALIGN bytes at the offset listed in the header
+MAGIC, VERSION, ALIGN = b'RRTWORLD', 1, 64
+
+def cache_path(obstacle_path):
+    return "%s.world"%obstacle_path
+
+def _digest(path):
+    with open(path, 'rb') as f: return hashlib.sha1(f.read()).hexdigest()
+
+def _source(obstacle_path):
+    st = os.stat(obstacle_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _params(grid_resolution, index_resolution):
+    return {'version': VERSION, 'grid_resolution': grid_resolution, 'index_resolution': index_resolution}
+
+def _arrays(world):
+    """ Arrays and scalars needed to rebuild the world without its text file """
+    arrays = {'edges': world.edges, 'starts': world._starts, 'cols': world._cols}
+    meta   = {'bounds': [b.tolist() for b in world.bounds]}
+    if world.index is not None:
+        arrays.update(index_cell_edges=world.index.cell_edges, index_cell_start=world.index.cell_start)
+        meta['index'] = {'origin': world.index.origin.tolist(), 'resolution': world.index.resolution,
+                         'shape': list(world.index.shape), 'tol': world.index.tol}
+    if world.grid is not None:
+        arrays['grid_cells'] = world.grid.cells
+        meta['grid'] = {'origin': world.grid.origin.tolist(), 'resolution': world.grid.resolution}
+    return arrays, meta
+
+def save(path, world, meta):
+    """ Writes the compiled world. The file is written aside and renamed into place, so
+    concurrent readers see either the old or the new file, never a partial one """
+    arrays, extra = _arrays(world)
+    meta   = dict(meta, **extra)
+    layout = {}
+    offset = 0
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        layout[name] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+    meta['arrays'] = layout
+
+    header = json.dumps(meta).encode()
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGN)
+    tmp = "%s.%d.tmp"%(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + np.uint64(len(header)).tobytes() + header)
+        base = f.tell()
+        for name, a in arrays.items():
+            f.seek(base + layout[name]['offset'])
+            f.write(np.ascontiguousarray(a).tobytes())
+        f.truncate(base + offset)
+    os.replace(tmp, path)
+
+def read_header(path):
+    """ Header of a compiled world and the offset of its arrays, None if it is not one """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC: return None
+            size = int(np.frombuffer(f.read(8), np.uint64)[0])
+            return json.loads(f.read(size).decode()), len(MAGIC) + 8 + size
+    except (OSError, ValueError, IndexError):
+        return None
+
+def load(path, header=None):
+    """ World of a compiled file. The arrays are memory-mapped read-only, so loading costs
+    no parsing and the pages are shared by every process using the same world """
+    meta, base = header or read_header(path)
+    # Plain ndarray views of the maps, the memmap subclass adds overhead to every indexing
+    arrays = {name: np.asarray(np.memmap(path, np.dtype(a['dtype']), 'r', base + a['offset'], tuple(a['shape'])))
+              if np.prod(a['shape']) else np.zeros(a['shape'], np.dtype(a['dtype']))
+              for name, a in meta['arrays'].items()}
+    index, grid = None, None
+    if 'index' in meta:
+        i = meta['index']
+        index = EdgeGrid.from_arrays(i['origin'], i['resolution'], i['shape'],
+                                     arrays['index_cell_edges'], arrays['index_cell_start'], i['tol'])
+    if 'grid' in meta:
+        grid = OccupancyGrid.from_arrays(meta['grid']['origin'], meta['grid']['resolution'], arrays['grid_cells'])
+    return Obstacles.from_arrays(arrays['edges'], arrays['starts'], index, grid, arrays['cols'], meta['bounds'])
+
+def load_world(obstacle_path, grid_resolution=None, index_resolution=None, compiled=None):
+    """ Obstacles of the world file, compiled on first use into a binary file next to it
+    (or at 'compiled'). The compiled file is used as long as the world file and the grid
+    parameters are unchanged: a world file with a new size or modification time is hashed,
+    and recompiled only if its content differs """
+    compiled = compiled or cache_path(obstacle_path)
+    source   = _source(obstacle_path)
+    params   = _params(grid_resolution, index_resolution)
+    header   = read_header(compiled)
+    if header is not None and header[0]['params'] == params:
+        meta = header[0]
+        if meta['source'] == source: return load(compiled, header)
+        digest = _digest(obstacle_path)
+        if meta['sha1'] == digest:
+            world = load(compiled, header)
+            _write(compiled, world, source, digest, params) # Only the timestamp changed
+            return world
+    else:
+        digest = _digest(obstacle_path)
+
+    world = Obstacles(get_obstacle_course(obstacle_path).to_polygons(), grid_resolution, index_resolution)
+    _write(compiled, world, source, digest, params)
+    return world
+
+def _write(compiled, world, source, digest, params):
+    try:
+        save(compiled, world, {'source': source, 'sha1': digest, 'params': params})
+    except OSError:
+        pass # Read-only location, the world is still used for this run
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Compiles obstacle worlds to the binary format loaded by --world-cache",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("obstacle_paths", nargs="+", help="Obstacle filepaths")
+    parser.add_argument("--grid-resolution", default=None, type=float,
+                            help="Cell size of the occupancy grid (disabled if unset)")
+    parser.add_argument("--index-resolution", default=None, type=float,
+                            help="Cell size of the obstacle edge index (automatic if unset, 0 disables)")
+
+    args = parser.parse_args()
+    for path in args.obstacle_paths:
+        world = load_world(path, args.grid_resolution, args.index_resolution)
+        print("%s: %d obstacles, %d edges -> %s (%d bytes)"%(path, len(world._starts), len(world.edges),
+              cache_path(path), os.path.getsize(cache_path(path))), file=sys.stderr)
@@ -0,0 +1,120 @@
+from __future__ import division
+
+import math
+import argparse
+import numpy as np
+
+from obstacles import _orient, segments_intersect
+
+def _area(vertices):
+    """ Shoelace area of a closed (k, 2) vertex loop """
+    x, y = vertices[:-1].T
+    u, v = vertices[1:].T
+    return abs(np.dot(x, v) - np.dot(u, y)) / 2
+
+def _is_simple(vertices):
+    """ Whether the closed (k, 2) vertex loop is a simple polygon without collinear corners """
+    p, q = vertices[:-1].astype(float), vertices[1:].astype(float)
+    k    = len(p)
+    if (_orient(np.roll(p, 1, 0), p, q) == 0).any(): return False
+    i, j = np.triu_indices(k, 2)
+    keep = ~((i == 0) & (j == k-1))
+    return not segments_intersect(p[i[keep]], q[i[keep]], p[j[keep]], q[j[keep]]).any()
+
+def generate(n, size=None, complexity=8, density=0.3, passage=10, walls=True, rng=np.random):
+    """ Random world of n star-shaped polygons with integer vertices, and a start and goal.
+
+    The map is split into a square lattice of cells and every polygon lies in its own cell,
+    at least passage/2 + 1 away from the cell border. The lattice lines therefore form a
+    connected network of free corridors, every gap between obstacles is at least 'passage'
+    wide, and any start and goal on the lattice lines can reach each other.
+
+    complexity : max number of vertices per polygon (at least 3)
+    density    : target fraction of the map covered by obstacles, capped by what fits
+                 in the cells once the passages are cleared
+    size       : side of the map, by default 50 units per lattice cell
+    walls      : enclose the map with four walls like world_obstacles.txt
+
+    Returns the list of closed (k+1, 2) vertex arrays, the start and the goal """
+    m      = max(int(math.ceil(math.sqrt(n))), 1)
+    wall   = 5 if walls else 0
+    border = wall + int(math.ceil(passage/2)) + 1
+    cell   = int((size - 2*border) // m) if size is not None else 50
+    margin = passage/2 + 1
+    r_max  = cell/2 - margin
+    if r_max < 1: raise ValueError("Cells of %d units are too small for %g wide passages"%(cell, passage))
+    size   = 2*border + m*cell
+
+    # Every polygon is scaled to the target area and shifted randomly inside its cell
+    target = density * (m*cell)**2 / max(n, 1)
+    cells  = rng.permutation(m*m)[:n]
+    polygons = []
+    for c in cells:
+        # Rounding to integers can break small polygons, those are drawn again
+        vertices = None
+        while vertices is None or not _is_simple(vertices):
+            k      = rng.randint(3, max(complexity, 3) + 1)
+            angles = (np.arange(k) + 0.8*rng.random_sample(k)) * 2*math.pi / k
+            loop   = np.c_[np.cos(angles), np.sin(angles)] * (0.5 + 0.5*rng.random_sample(k))[:,None]
+            loop   = np.vstack([loop, loop[:1]])
+            extent = np.abs(loop).max()
+            scale  = min(math.sqrt(target / _area(loop)), r_max / extent)
+            slack  = r_max - scale*extent
+            center = border + (np.array([c % m, c // m]) + 0.5) * cell + rng.uniform(-slack, slack, 2)
+            vertices = np.round(center + loop*scale).astype(int)
+        polygons.append(vertices)
+
+    if walls:
+        for x0, y0, x1, y1 in [(0, 0, wall, size), (size-wall, 0, size, size),
+                               (0, 0, size, wall), (0, size-wall, size, size)]:
+            polygons.append(np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]))
+
+    # Start and goal on vertical lattice lines in the first and last quarter of the map
+    lines = border + cell * np.arange(m+1)
+    q     = max((m+1)//4, 1)
+    start = (int(lines[rng.randint(0, q)]),  int(rng.randint(border, size-border+1)))
+    goal  = (int(lines[rng.randint(m+1-q, m+1)]), int(rng.randint(border, size-border+1)))
+    return polygons, start, goal
+
+def coverage(polygons, size):
+    """ Fraction of the map covered by the polygons, ignoring overlaps """
+    return sum(_area(np.asarray(v, float)) for v in polygons) / size**2
+
+def write_world(path, polygons):
+    """ Writes the polygons in the format read by utilities.get_obstacle_course """
+    with open(path, 'w') as f:
+        f.write("%d\n"%len(polygons))
+        for vertices in polygons:
+            f.write("%d\n"%(len(vertices)-1))
+            f.writelines("%d %d\n"%tuple(v) for v in vertices[:-1])
+
+def write_start_and_goal(path, start, goal):
+    """ Writes the start and goal in the format read by utilities.get_start_and_goal """
+    with open(path, 'w') as f:
+        f.write("%d %d\n%d %d\n"%(tuple(start) + tuple(goal)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Generates random obstacle worlds with a solvable start and goal",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-n", "--count", default=100, type=int, help="Number of obstacles")
+    parser.add_argument("--size", default=None, type=int,
+                            help="Side of the map (50 units per obstacle cell if unset)")
+    parser.add_argument("--complexity", default=8, type=int, help="Max number of vertices per obstacle")
+    parser.add_argument("--density", default=0.3, type=float, help="Fraction of the map covered by obstacles")
+    parser.add_argument("--passage", default=10, type=float, help="Minimum width of the gaps between obstacles")
+    parser.add_argument("--no-walls", action="store_true", help="Do not enclose the map with walls")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    parser.add_argument("--obstacle-path", default="generated_obstacles.txt", help="Output obstacle filepath")
+    parser.add_argument("--goal-path", default="generated_start_goal.txt", help="Output start/goal filepath")
+
+    args = parser.parse_args()
+
+    polygons, start, goal = generate(args.count, args.size, args.complexity, args.density, args.passage,
+                                     not args.no_walls, np.random.RandomState(args.seed))
+    write_world(args.obstacle_path, polygons)
+    write_start_and_goal(args.goal_path, start, goal)
+
+    size = max(v.max() for v in polygons)
+    print("%d obstacles, %d edges, map %d x %d, coverage %.3f, start %s, goal %s"%(len(polygons),
+          sum(len(v)-1 for v in polygons), size, size, coverage(polygons, size), start, goal))